@@ -2,6 +2,9 @@
 
 # imports
 # from queue import PriorityQueue
+import bisect
+import heapq
+from itertools import islice
 
 import settings
 
@@ -12,27 +15,87 @@ class Building:
     def __init__(self, floors):
         self.floor_order = floors
         self.floor = {}
-        for i in floors:
-            self.floor[i] = Floor(self, i)
-        # self.all_arrivals = [] #(time, person, floor)
+        for idx, i in enumerate(floors):
+            self.floor[i] = Floor(self, i, idx)
+
+        # floor-to-floor lookup tables, indexed by Floor.index
+        #   distance[a][b]: number of floors between a and b
+        #   direction[a][b]: direction of b from a ("up", "down" or "same")
+        self.distance = [[abs(b - a) for b in range(len(floors))] for a in range(len(floors))]
+        self.direction = [
+            ["up" if a < b else "down" if a > b else "same" for b in range(len(floors))]
+            for a in range(len(floors))]
+
+        # hall call index, kept up to date by the floors as people are pushed and removed
+        #   hall_calls[direction]: sorted indices of floors with people waiting to go <direction>
+        #   call_floors: sorted indices of floors with anyone waiting
+        #   calls_version: changes whenever a hall call is placed or cleared
+        #   queue_version: changes whenever anyone is pushed to or removed from a floor queue
+        self.num_waiting = 0
+        self.hall_calls = {"up": [], "down": []}
+        self.call_floors = []
+        self.calls_version = 0
+        self.queue_version = 0
+
+    def _call_placed(self, floor, direction):
+        """records that the first person is waiting at <floor> to go <direction>"""
+        self.calls_version += 1
+        bisect.insort(self.hall_calls[direction], floor.index)
+        if floor.num_waiting() == 1:
+            bisect.insort(self.call_floors, floor.index)
+
+    def _call_cleared(self, floor, direction):
+        """records that nobody is left waiting at <floor> to go <direction>"""
+        self.calls_version += 1
+        calls = self.hall_calls[direction]
+        del calls[bisect.bisect_left(calls, floor.index)]
+        if floor.num_waiting() == 0:
+            del self.call_floors[bisect.bisect_left(self.call_floors, floor.index)]
+
+    def calls(self, direction=None):
+        """yields each floor with people waiting, from the bottom of the building up
 
-    # def push(self, time, person, floor):
-    #     """add to the queue"""
-    #     self.all_arrivals.append((time, person, floor))
-    #     self.all_arrivals.sort(key=lambda x: x[0])
+        Args:
+            direction: (optional) "up" or "down", only floors with people waiting to go that way
+        """
+        indices = self.call_floors if direction is None else self.hall_calls[direction]
+        for i in indices:
+            yield self.floor[self.floor_order[i]]
+
+    def hall_call_lanes(self):
+        """yields the FloorQueue of every active hall call, from the bottom of the building up"""
+        for i in self.calls():
+            if i.up_queue:
+                yield i.up_queue
+            if i.down_queue:
+                yield i.down_queue
 
-    # def peak(self):
-    #     """get first entry"""
-    #     return self.all_arrivals[0]
+    def nearest_call(self, floor, direction, call_direction=None):
+        """returns the closest floor with people waiting, strictly <direction> of <floor>
 
-    # def remove(self, person):
-    #     """remove the head of the list"""
-    #     self.all_arrivals.remove(person)
+        Args:
+            floor: floor to search from
+            direction: "up" or "down", which way to search from <floor>
+            call_direction: (optional) "up" or "down", only consider people traveling that way
+
+        Ret:
+            Floor instance, or None if nobody is waiting that way
+        """
+        indices = self.call_floors if call_direction is None else self.hall_calls[call_direction]
+        if direction == "up":
+            pos = bisect.bisect_right(indices, floor.index)
+            if pos == len(indices):
+                return None
+        else:
+            pos = bisect.bisect_left(indices, floor.index) - 1
+            if pos < 0:
+                return None
+        return self.floor[self.floor_order[indices[pos]]]
 
     def get_all_arrivals(self):
         """returns a list of all arrivals on all floors"""
         ret = []
-        for i in self.floor.values():
+        for i in self.calls():
             ret.extend(i.queue)
         return ret
 
@@ -40,28 +103,78 @@ class Floor:
     """models each floor of a building
 
     Note: because elevators will pull those waiting into the elevator in different ways (maybe
-          according to different algorithms), the floor queue is just a sorted list, not a real
-          queue datatype.
+          according to different algorithms), people waiting at a floor are not kept in a real
+          queue datatype. They are split into an up lane and a down lane (FloorQueue instances),
+          each in order of arrival, and self.queue merges the two back together.
     """
 
-    def __init__(self, building, name):
-        """constructor"""
+    def __init__(self, building, name, index):
+        """constructor
+
+        Args:
+            building: building the floor belongs to
+            name: name of the floor (ex: 'G')
+            index: position of the floor in building.floor_order (0 is the lowest floor)
+        """
         self.building = building
         self.name = name
-        self.queue = [] #(time, person)
+        self.index = index
+        self.up_queue = FloorQueue(self, "up")
+        self.down_queue = FloorQueue(self, "down")
+        self._pushes = 0 # breaks ties between people pushed at the same time
+
+    @property
+    def queue(self):
+        """list of everyone waiting at this floor in order of arrival: [(time, person), ...]"""
+        return [(i[0], i[2]) for i in self._merged()]
+
+    def _merged(self):
+        """iterates over the entries of both lanes in order of arrival"""
+        if not self.down_queue:
+            return iter(self.up_queue.entries())
+        if not self.up_queue:
+            return iter(self.down_queue.entries())
+        return heapq.merge(self.up_queue.entries(), self.down_queue.entries())
+
+    def lane(self, person):
+        """returns the FloorQueue a person waits in (based on their direction of travel)"""
+        if person.origin < person.destination:
+            return self.up_queue
+        return self.down_queue
+
+    def num_waiting(self):
+        """returns the number of people waiting at this floor"""
+        return len(self.up_queue) + len(self.down_queue)
 
     def push(self, person, time):
         """add to the queue"""
-        self.queue.append((time, person))
-        self.queue.sort(key=lambda x: x[0])
-        # self.building.push(time, person, self)
+        lane = self.lane(person)
+        self._pushes += 1
+        lane.push(time, self._pushes, person)
+        self.building.num_waiting += 1
+        self.building.queue_version += 1
+        if len(lane) == 1:
+            self.building._call_placed(self, lane.direction) # pylint: disable=W0212
 
     def remove(self, person):
-        """remove instance i from queue (person comparators have been implemented)"""
-        for idx, i in enumerate(self.queue):
-            if person == i[1]:
-                self.queue.pop(idx)
-                return
+        """remove instance i from queue"""
+        lane = self.lane(person)
+        if lane.remove(person):
+            self.building.num_waiting -= 1
+            self.building.queue_version += 1
+            if len(lane) == 0:
+                self.building._call_cleared(self, lane.direction) # pylint: disable=W0212
+
+    def first(self, num=None):
+        """return the first <num> people waiting (in either direction) in order of arrival
+
+        Args:
+            num: number of queued "person" instances to return (all if not specified)
+
+        Ret:
+            list of person objects
+        """
+        return [i[2] for i in islice(self._merged(), num)]
 
     def up(self, num=None):
         """return first <num> queued objects going up
@@ -70,16 +183,9 @@ class Floor:
             num: number of queued "person" instances to return
 
         Ret:
-            yields each person object in queue going up
+            list of person objects in queue going up
         """
-        cnt = 0
-        for i in self.queue:
-            if num is not None and cnt >= num:
-                break
-
-            if i[1].origin < i[1].destination:
-                yield i[1]
-                cnt += 1
+        return self.up_queue.first(num)
 
     def down(self, num=None):
         """return first <num> queued objects going down
@@ -88,16 +194,9 @@ class Floor:
             num: number of queued "person" instances to return
 
         Ret:
-            yields each person object in queue going up
+            list of person objects in queue going down
         """
-        cnt = 0
-        for i in self.queue:
-            if num is not None and cnt >= num:
-                break
-
-            if i[1].origin > i[1].destination:
-                yield i[1]
-                cnt += 1
+        return self.down_queue.first(num)
 
     def dir_to(self, cmp):
         """returns the direction of cmp floor from self
@@ -107,15 +206,11 @@ class Floor:
             "down" for down
             "same" if they're the same floor
         """
+        return self.building.direction[self.index][cmp.index]
 
-        if self < cmp:
-            return "up"
-        elif self > cmp:
-            return "down"
-        elif self == cmp:
-            return "same"
-        else:
-            raise ValueError("Inappropriate argument cmp = {}".format(cmp))
+    def distance_to(self, cmp):
+        """returns the number of floors between self and cmp"""
+        return self.building.distance[self.index][cmp.index]
 
     def __str__(self):
         return self.name
@@ -124,17 +219,80 @@ class Floor:
         return "Floor({})".format(self.name)
 
     def __lt__(self, cmp):
-        floor_order = self.building.floor_order
-        return floor_order.index(self.name) < floor_order.index(cmp.name)
+        return self.index < cmp.index
 
     def __gt__(self, cmp):
-        floor_order = self.building.floor_order
-        return floor_order.index(self.name) > floor_order.index(cmp.name)
+        return self.index > cmp.index
 
     def __eq__(self, cmp):
         return self.name == cmp.name
 
-
     def __sub__(self, cmp):
-        floor_order = self.building.floor_order
-        return floor_order.index(self.name) - floor_order.index(cmp.name)
+        return self.index - cmp.index
+
+
+class FloorQueue:
+    """people waiting at a floor to travel in one direction, in order of arrival
+
+    Entries are kept in a dict keyed by person id (dicts preserve insertion order), so a specific
+    person can be removed in O(1). People are pushed at the current simulation time, which never
+    decreases, so a push is normally an O(1) append. An out of order push is still supported, it
+    is placed with a binary search and the dict is rebuilt.
+    """
+
+    def __init__(self, floor, direction):
+        """constructor
+
+        Args:
+            floor: floor the lane belongs to
+            direction: "up" or "down", direction the people in this lane are traveling
+        """
+        self.floor = floor
+        self.direction = direction
+        self._entries = {} # person.id -> (time, seq, person)
+
+    def push(self, time, seq, person):
+        """add a person to the end of the lane
+
+        Args:
+            time: time the person arrived at the floor
+            seq: tie breaker for people arriving at the same time (increasing)
+            person: person instance
+        """
+        entry = (time, seq, person)
+        if self._entries and entry[:2] < self.newest()[:2]:
+            entries = list(self._entries.values())
+            entries.insert(bisect.bisect([i[:2] for i in entries], entry[:2]), entry)
+            self._entries = {i[2].id: i for i in entries}
+        else:
+            self._entries[person.id] = entry
+
+    def remove(self, person):
+        """remove a person from the lane
+
+        Ret:
+            whether or not the person was waiting in the lane
+        """
+        return self._entries.pop(person.id, None) is not None
+
+    def entries(self):
+        """returns a view of (time, seq, person) entries in order of arrival"""
+        return self._entries.values()
+
+    def first(self, num=None):
+        """returns a list of the first <num> people in the lane (all if not specified)"""
+        return [i[2] for i in islice(self._entries.values(), num)]
+
+    def oldest(self):
+        """returns the entry that has been waiting the longest (None if the lane is empty)"""
+        return next(iter(self._entries.values()), None)
+
+    def newest(self):
+        """returns the entry that arrived most recently (None if the lane is empty)"""
+        return next(reversed(self._entries.values()), None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return (i[2] for i in self._entries.values())
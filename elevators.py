@@ -1,36 +1,52 @@
 """All of the elevator classes"""
 
 # standard imports
+import bisect
 from enum import Enum, auto
 
+# third party imports
+import numpy as np
+
 # local imports
 import settings
 
+DIRECTION_SIGNS = {"up": 1, "down": -1}
+
+# number of scores (calls x elevators) from which dispatching scores them with numpy
+VECTORIZE_MIN_SCORES = 64
+
 class Elevator:
     """base abstract class for elevator cars"""
 
-    elevator_cnt = 0
-
     class States(Enum):
         """states implemented for elevators"""
         IDLE = auto()
         STOPPED = auto() # stopped at a floor for servicing
         MOVING = auto() # moving between floors
 
-    def __init__(self, logger, building, capacity=settings.DEFAULT_CAPACITY):
+    def __init__(self, sim, capacity=settings.DEFAULT_CAPACITY):
+        """Elevator Constructor
+
+        The elevator adds itself to the simulation (and gets its id from it), which keeps track
+        of whether or not it's idle.
+
+        Args:
+            sim: simulation (engine.Simulation) the elevator belongs to
+            capacity: (optional) max number of passengers
+        """
         self.state = self.States.IDLE
-        self.id = self.__class__.elevator_cnt
-        self._logger = logger
-        self._building = building
+        self.id = sim.add_elevator(self)
+        self._sim = sim
+        self._building = sim.building
         self.capacity = capacity # max capacity
-        self.curr_floor = building.floor['1'] # starts on 1st floor
-        self.passengers = []
+        self.curr_floor = self._building.floor['1'] # starts on 1st floor
+        self.num_passengers = 0
+        self._manifest = {} # destination floor index -> passengers going there, in boarding order
+        self._stops = [] # sorted indices of the floors passengers are going to
         self.next_dest = None
         self.sectors = []
         self.direction = None
 
-        self.__class__.elevator_cnt += 1
-
     def _load_passengers(self, destinations=None, direction=None):
         """load passengers from queue at current floor
 
@@ -47,7 +63,7 @@ class Elevator:
         """
 
         # if elevator has no capacity, return
-        if not len(self.passengers) < self.capacity:
+        if not self.num_passengers < self.capacity:
             return
 
         # only one argument may be specified
@@ -55,18 +71,16 @@ class Elevator:
             raise Exception("Only one argument may be specified (either desitnation or direction).")
 
         if destinations is not None: # destinations specified
-            for floor in destinations: # for each specified floor
-                # quanitify new passengers
-                new_passengers = []
-                for _, i in self.curr_floor.queue:
-                    if len(self.passengers)+len(new_passengers) >= self.capacity:
-                        break
-                    if i.destination == floor:
-                        new_passengers.append(i)
-
-                # add new passengers to elevator and remove them from the list
-                # of arrivals
-                for i in new_passengers:
+            # sort everyone waiting by destination in a single pass over the queue
+            waiting = {floor.index: [] for floor in destinations}
+            for i in self.curr_floor.first():
+                if i.destination.index in waiting:
+                    waiting[i.destination.index].append(i)
+
+            # add new passengers to elevator (in order of the specified floors, then of arrival)
+            # and remove them from the list of arrivals
+            for new_passengers in waiting.values():
+                for i in new_passengers[:self.rem_cap()]:
                     self._add_passenger(i)
 
         elif direction is not None: # direction is specified
@@ -78,18 +92,21 @@ class Elevator:
                     self._add_passenger(i)
 
         else: # load all at floor in order of arrival
-            for i in self.curr_floor.queue[:self.rem_cap()]:
-                self._add_passenger(i[1])
+            for i in self.curr_floor.first(self.rem_cap()):
+                self._add_passenger(i)
 
     def unload_passengers(self):
         """unload passengers for current floor
 
         anyone who has arrived at their destination is removed from the elevator
         """
-        for person in self.passengers[:]:
-            if person.destination == self.curr_floor:
-                self.passengers.remove(person)
-                person.update_state(person.States.IDLE)
+        arrived = self._manifest.pop(self.curr_floor.index, None)
+        if arrived is None:
+            return
+        del self._stops[bisect.bisect_left(self._stops, self.curr_floor.index)]
+        self.num_passengers -= len(arrived)
+        for person in arrived:
+            person.update_state(person.States.IDLE)
 
     def _add_passenger(self, person):
         """adds a passenger from the current floor
@@ -97,7 +114,12 @@ class Elevator:
         Args:
             person: person instance to be added to the elevator
         """
-        self.passengers.append(person)
+        dest = person.destination.index
+        if dest not in self._manifest:
+            self._manifest[dest] = []
+            bisect.insort(self._stops, dest)
+        self._manifest[dest].append(person)
+        self.num_passengers += 1
         self.curr_floor.remove(person)
         person.curr_elevator = self
         person.update_state(person.States.SERVICE)
@@ -120,7 +142,11 @@ class Elevator:
             return
 
         # update to new state
+        if (self.state == self.States.IDLE) != (state == self.States.IDLE):
+            self._sim.set_idle(self, state == self.States.IDLE)
         self.state = state
+        if self._sim.metrics is not None:
+            self._sim.metrics.elevator_updated(self)
 
         # act for current state, decide next state
         if self.state == self.States.STOPPED:
@@ -128,7 +154,7 @@ class Elevator:
             self.curr_floor = self.next_dest
 
             # unload passengers
-            if len(self.passengers) > 0:
+            if self.num_passengers > 0:
                 self.unload_passengers()
 
             # load new passengers (specific to algorithm)
@@ -143,24 +169,54 @@ class Elevator:
                 next_state = self.States.MOVING
 
             # start moving after some loading time (flat 15 seconds for now)
-            settings.FEQ.put_nowait((settings.CURR_TIME + 15, self, next_state))
+            self._sim.feq.put(self._sim.curr_time + 15, self, next_state)
 
         elif self.state == self.States.MOVING:
             # determing how long until next destination is reached, add event to feq
-            settings.FEQ.put_nowait((
-                settings.CURR_TIME + 1
-                + settings.ELEVATOR_SPEED*abs(self.next_dest-self.curr_floor),
+            self._sim.feq.put(
+                self._sim.curr_time + 1
+                + settings.ELEVATOR_SPEED*self.next_dest.distance_to(self.curr_floor),
                 self,
-                self.States.STOPPED))
+                self.States.STOPPED)
 
         if settings.VERBOSE:
             print("{:.2f} Elevator: {} {} -> {}, {}".format(
-                settings.CURR_TIME,
+                self._sim.curr_time,
                 self.state,
                 self.curr_floor,
                 self.next_dest,
                 self.passengers))
 
+    @property
+    def dispatcher(self):
+        """object that wakes the elevator up when someone queues (None: the simulation itself, see
+        engine.Simulation.person_queued)"""
+        return None
+
+    @property
+    def passengers(self):
+        """list of everyone in the elevator, by destination (bottom of the building up)"""
+        return [person for i in self._stops for person in self._manifest[i]]
+
+    def nearest_dropoff(self, direction):
+        """returns the closest passenger destination, strictly <direction> of the current floor
+
+        Args:
+            direction: "up" or "down"
+
+        Ret:
+            Floor instance, or None if no passenger is going that way
+        """
+        if direction == "up":
+            pos = bisect.bisect_right(self._stops, self.curr_floor.index)
+            if pos == len(self._stops):
+                return None
+        else:
+            pos = bisect.bisect_left(self._stops, self.curr_floor.index) - 1
+            if pos < 0:
+                return None
+        return self._building.floor[self._building.floor_order[self._stops[pos]]]
+
     def get_next_dest(self):
         """This must be implented in each subclass, based on the algorithm"""
         raise NotImplementedError()
@@ -175,7 +231,7 @@ class Elevator:
 
     def rem_cap(self):
         """returns the remaining capacity of the elevator"""
-        return self.capacity - len(self.passengers)
+        return self.capacity - self.num_passengers
 
     def change_direction(self):
         """change directions"""
@@ -216,13 +272,13 @@ class BasicElevator(Elevator):
             self.destination_queue.remove(self.curr_floor)
 
         # look for waiting passengers, add destinations
-        for floor in [i for i in self._building.floor.values()]:
-            if len(floor.queue) > 0 and floor not in self.destination_queue:
+        for floor in self._building.calls():
+            if floor not in self.destination_queue:
                 print("floor {} queue: {}".format(floor.name, floor.queue))
                 self.destination_queue.append(floor)
 
         # if someone is waiting at current floor
-        if len(self.curr_floor.queue) > 0 and self.rem_cap() > 0:
+        if self.curr_floor.num_waiting() > 0 and self.rem_cap() > 0:
             return self.curr_floor
 
         # return next destination if there is one
@@ -253,13 +309,13 @@ class ScanElevator(Elevator):
 
     def get_next_dest(self):
         max_index = len(self._building.floor_order)-1
-        current_floor_index = self._building.floor_order.index(self.curr_floor.name)
+        current_floor_index = self.curr_floor.index
         if settings.VERBOSE:
             print("Current Floor: ", self.curr_floor.name)
 
         # go to idle if no passengers and no one waitin
-        if (sum([len(i.queue) for i in self._building.floor.values()]) == 0
-                and len(self.passengers) == 0):
+        if (self._building.num_waiting == 0
+                and self.num_passengers == 0):
             return None
 
         # if at the edge swap directions
@@ -267,18 +323,15 @@ class ScanElevator(Elevator):
             self.change_direction()
 
         # get the next destination in that direction
-        # passenger pickup locations in the same direction
+        # closest passenger pickup location in the same direction
         pickup_loc = [
-            i.origin for floor in self._building.floor_order
-            for _, i in self._building.floor[floor].queue
-            if self.curr_floor.dir_to(i.origin) == self.direction]
-        # passenger dropoff locations in the same direction
-        dropoff_loc = [
-            i.destination for i in self.passengers
-            if self.curr_floor.dir_to(i.destination) == self.direction]
+            i for i in [self._building.nearest_call(self.curr_floor, self.direction)]
+            if i is not None]
+        # closest passenger dropoff location in the same direction
+        dropoff_loc = [i for i in [self.nearest_dropoff(self.direction)] if i is not None]
 
         if len(pickup_loc + dropoff_loc) > 0:
-            return min(pickup_loc + dropoff_loc, key=lambda x: abs(self.curr_floor - x))
+            return min(pickup_loc + dropoff_loc, key=self.curr_floor.distance_to)
         else:
             if self.direction == "up":
                 # return top floor
@@ -301,13 +354,13 @@ class LookElevator(Elevator):
 
     def get_next_dest(self, recurse=True):
         max_index = len(self._building.floor_order)-1
-        current_floor_index = self._building.floor_order.index(self.curr_floor.name)
+        current_floor_index = self.curr_floor.index
         if settings.VERBOSE:
             print("Current Floor: ", self.curr_floor.name)
 
         # return to idle if no passengers are waiting and there are no more arrivals
-        if (sum([len(i.queue) for i in self._building.floor.values()]) == 0 and
-                settings.FEQ.qsize() == 0 and len(self.passengers) == 0):
+        if (self._building.num_waiting == 0 and
+                self._sim.quiescent() and self.num_passengers == 0):
             return None
 
         # if at the edge swap directions
@@ -315,18 +368,15 @@ class LookElevator(Elevator):
             self.change_direction()
 
         # get the next destination in that direction
-        # passenger pickup locations in the same direction
+        # closest passenger pickup location in the same direction
         pickup_loc = [
-            i.origin for floor in self._building.floor_order
-            for _, i in self._building.floor[floor].queue
-            if self.curr_floor.dir_to(i.origin) == self.direction]
-        # passenger dropoff locations in the same direction
-        dropoff_loc = [
-            i.destination for i in self.passengers
-            if self.curr_floor.dir_to(i.destination) == self.direction]
+            i for i in [self._building.nearest_call(self.curr_floor, self.direction)]
+            if i is not None]
+        # closest passenger dropoff location in the same direction
+        dropoff_loc = [i for i in [self.nearest_dropoff(self.direction)] if i is not None]
 
         if len(pickup_loc + dropoff_loc) > 0:
-            return min(pickup_loc + dropoff_loc, key=lambda x: abs(self.curr_floor - x))
+            return min(pickup_loc + dropoff_loc, key=self.curr_floor.distance_to)
         elif recurse:
             if settings.VERBOSE:
                 print("changing directions, recursing")
@@ -344,33 +394,268 @@ class LookElevator(Elevator):
 # MULTI-ELEVATOR ALGORITHMS
 
 class ElevatorController:
-    """Base Elevator Car Controller for algorithms that use several elevators"""
+    """Base Elevator Car Controller for algorithms that use several elevators
+
+    Controllers dispatch hall calls in one of two modes (see assignments):
+        batch: every hall call is dispatched again whenever the calls or an elevator change
+        incremental: a hall call is dispatched when it's placed, and again only when the
+                     elevator it was sent to changes state, or when its oldest arrival reaches one
+                     of the controller's WAIT_THRESHOLDS
+    """
 
-    def __init__(self, building):
-        self._building = building
+    # how long (seconds) the oldest arrival of a hall call has waited when it's dispatched again
+    # in incremental mode
+    WAIT_THRESHOLDS = ()
+
+    def __init__(self, sim, incremental=settings.INCREMENTAL_DISPATCH):
+        """ElevatorController Constructor
+
+        Args:
+            sim: simulation (engine.Simulation) the controlled elevators belong to
+            incremental: (optional) dispatch hall calls incrementally instead of in batches
+        """
+        self._sim = sim
+        self._building = sim.building
         self.elevators = []
+        self.incremental = incremental
+        self._assignments = None # elevator -> assigned floors (see assignments)
+        self._assignments_key = None
+
+        # incremental dispatch state
+        #   _owners: hall call (FloorQueue) -> elevators it was sent to
+        #   _signatures: elevator -> its state when its calls were dispatched (see _sync)
+        #   _deadlines: hall call -> time of its pending wait threshold event
+        #   _calls_seen: Building.calls_version the hall calls were last synced at
+        self._owners = {}
+        self._signatures = {}
+        self._deadlines = {}
+        self._calls_seen = None
 
     def spawn_elevators(self, num_elevators, *args, **kwargs):
         """creates controlled elevartors
 
         Args:
             num_elevators: number of elevators to spawn
-            other: required and optional arguments pass to ControlledElevator constructor
+            other: optional arguments passed to the Elevator constructor (ex: capacity)
         """
         self.elevators.extend(
-            [ControlledElevator(self, *args, **kwargs)for _ in range(num_elevators)])
+            [ControlledElevator(self, self._sim, *args, **kwargs) for _ in range(num_elevators)])
+
+    def get_next_dest(self, elevator, ch_dir=True):
+        """called by each controlled elevator, returns the closest destination in its direction
+
+        The destination is the closest of the elevator's passenger dropoffs and the floors in its
+        destination queue (see update_dests) in its current direction. If there's neither, the
+        elevator turns around and looks the other way.
+
+        Args:
+            elevator: controlled elevator asking for a destination
+            ch_dir: (optional) whether or not the elevator may change direction
+
+        Ret:
+            destination floor (None if there isn't any)
+        """
+        self.update_dests(elevator)
+
+        # find the closest passenger destination in the same direction
+        closest_pass_dest = elevator.nearest_dropoff(elevator.direction)
+
+        # find the closest pickup in the pickup queue
+        closest_caller_dest = min(
+            [i for i
+             in elevator.destination_queue
+             if elevator.curr_floor.dir_to(i) == elevator.direction],
+            key=elevator.curr_floor.distance_to,
+            default=None)
+
+        # get the closest destination (or None if neither destination exists)
+        next_dest = min(
+            [i for i in [closest_pass_dest, closest_caller_dest] if i is not None],
+            key=elevator.curr_floor.distance_to,
+            default=None)
+
+        # if neither destination exists, change direction and try again
+        if next_dest is None and ch_dir:
+            elevator.change_direction()
+
+            # prevent an infinite recursion by passing ch_dir=False
+            return self.get_next_dest(elevator, ch_dir=False)
 
-    def get_next_dest(self, elevator):
-        """called by each controlled elevator, must be implemented by each subclass"""
+        return next_dest
+
+    def update_dests(self, elevator):
+        """sets an elevator's destination queue to its share of the current assignment"""
+        elevator.destination_queue = list(self.assignments()[elevator])
+
+    def call_placed(self, _person):
+        """wakes up all of the idle elevators when someone queues (busy ones are skipped)
+
+        Every idle elevator is woken up: one that finds nothing to do turns around (see
+        get_next_dest), and which way it faces decides which calls it's sent to next.
+
+        Args:
+            _person: person who queued (unused, every idle elevator is woken up either way)
+        """
+        for elevator in self._sim.idle_elevators(self):
+            elevator.update_state()
+
+    def assignments(self):
+        """returns the hall calls assigned to each elevator
+
+        Elevators ask for their assignment every time they pick a destination, often several
+        times at the same instant and with nothing changed in between (ex: every idle car when
+        someone queues). In batch mode the assignment is cached and only recomputed when its
+        inputs (see assignment_key) change. In incremental mode only the hall calls affected by
+        what changed are dispatched again (see _sync).
+
+        Ret:
+            dict of elevator -> list of floors assigned to it (bottom of the building up)
+        """
+        if self.incremental:
+            if self._sync() or self._assignments is None:
+                self._assignments = {i: [] for i in self.elevators}
+                for call in self._building.hall_call_lanes():
+                    for elevator in self._owners[call]:
+                        self._assignments[elevator].append(call.floor)
+            return self._assignments
+
+        key = self.assignment_key()
+        if key != self._assignments_key:
+            self._assignments = self.assign_calls()
+            self._assignments_key = key
+        return self._assignments
+
+    def assignment_key(self):
+        """everything the assignment depends on: the hall calls, and the floor and direction of
+        each elevator"""
+        return (
+            self._building.calls_version,
+            tuple((i.curr_floor.index, i.direction) for i in self.elevators))
+
+    def assign_calls(self):
+        """computes the assignment of every hall call (see assignments)"""
+        assignments = {i: [] for i in self.elevators}
+        for call, elevator in self.dispatch(list(self._building.hall_call_lanes())):
+            assignments[elevator].append(call.floor)
+        return assignments
+
+    def dispatch(self, calls):
+        """sends hall calls to the elevators best suited to answer them, must be implemented by
+        each subclass
+
+        Args:
+            calls: FloorQueue of each hall call
+
+        Ret:
+            list of (call, elevator) pairs, a call may be sent to several elevators
+        """
         raise NotImplementedError()
 
+    def _sync(self):
+        """brings the incremental assignment up to date
+
+        Cleared hall calls are dropped, and new hall calls, and the calls sent to an elevator whose
+        state changed since it was last seen (stopped, started, moved, reversed, filled up or
+        emptied), are dispatched.
+
+        Ret:
+            whether or not the assignment changed
+        """
+        changed = set()
+        for elevator in self.elevators:
+            signature = (
+                elevator.state, elevator.curr_floor.index, elevator.direction,
+                elevator.rem_cap() == 0)
+            if self._signatures.get(elevator) != signature:
+                self._signatures[elevator] = signature
+                changed.add(elevator)
+
+        calls_changed = self._calls_seen != self._building.calls_version
+        if not changed and not calls_changed:
+            return False
+
+        calls = list(self._building.hall_call_lanes())
+        if calls_changed:
+            self._calls_seen = self._building.calls_version
+            active = set(calls)
+            for call in [i for i in self._owners if i not in active]:
+                del self._owners[call]
+
+        self._dispatch_calls([
+            i for i in calls
+            if i not in self._owners or not changed.isdisjoint(self._owners[i])])
+        return True
+
+    def _dispatch_calls(self, calls):
+        """dispatches hall calls in incremental mode
+
+        Idle elevators sent a call they didn't have are polled (see _poll_idle), and the calls'
+        wait threshold events are scheduled.
+
+        Ret:
+            whether or not any call was sent to different elevators
+        """
+        previous = {call: self._owners.get(call, []) for call in calls}
+
+        # owners are recorded after dispatching, dispatch can tell new calls (not in _owners yet)
+        # apart from calls dispatched again
+        pairs = self.dispatch(calls)
+        for call in calls:
+            self._owners[call] = []
+        for call, elevator in pairs:
+            self._owners[call].append(elevator)
+
+        self._poll_idle(
+            elevator for call in calls for elevator in self._owners[call]
+            if elevator not in previous[call])
+
+        if self.WAIT_THRESHOLDS:
+            for call in calls:
+                if call not in self._deadlines:
+                    self._schedule_threshold(call)
+        return any(self._owners[i] != previous[i] for i in calls)
+
+    def _poll_idle(self, elevators):
+        """schedules idle elevators that were sent new hall calls to ask for a destination (at the
+        current time), nothing else would wake them up"""
+        for elevator in sorted(set(elevators)):
+            if elevator.state == elevator.States.IDLE:
+                self._sim.feq.put(self._sim.curr_time, elevator, None)
+
+    def _schedule_threshold(self, call):
+        """schedules an event for the next wait threshold the oldest arrival of a call reaches"""
+        arrival_time = call.oldest()[0]
+        for threshold in self.WAIT_THRESHOLDS:
+            if arrival_time + threshold > self._sim.curr_time:
+                self._deadlines[call] = arrival_time + threshold
+                self._sim.feq.put(arrival_time + threshold, self, call)
+                return
+
+    def update_state(self, call):
+        """the oldest arrival of a hall call reached a wait threshold (incremental mode)
+
+        The call is dispatched again. The event is ignored if it was superseded, and once the call
+        is cleared.
+
+        Args:
+            call: FloorQueue of the hall call
+        """
+        if self._deadlines.get(call) != self._sim.curr_time:
+            return
+        del self._deadlines[call]
+        if not call:
+            return
+
+        if self._dispatch_calls([call]):
+            self._assignments = None
+
 class ControlledElevator(Elevator):
     """Elevator used by the elevator controller
     """
 
     def __init__(self, controller, *args, **kwargs):
+        self._controller = controller # set first, the simulation registers the elevator with it
         super(self.__class__, self).__init__(*args, **kwargs)
-        self._controller = controller
         self.destination_queue = []
         self.direction = "up"
         self.down_sector = None
@@ -381,10 +666,116 @@ class ControlledElevator(Elevator):
         """load_passengers into the elevator"""
         self._load_passengers()
 
+    @property
+    def dispatcher(self):
+        """the controller wakes the elevator up"""
+        return self._controller
+
     def get_next_dest(self):
         """Must be implemented by each algorithm subclass"""
         return self._controller.get_next_dest(self)
 
+    def update_state(self, state=None):
+        """Update the state of the elevator
+
+        In incremental mode, hall calls may have been dispatched to the elevator while it was
+        stopped on its way to idle, so it asks for a destination again once it's idle.
+        """
+        super().update_state(state)
+        if state == self.States.IDLE and self._controller.incremental:
+            self.update_state()
+
+def figures_of_suitability(elevators, calls, num_floors, sector_bounds=None, wait_times=None):
+    """scores every elevator for every hall call at once (see NearestCarElevatorController)
+
+    FS = (N + 2) - d for an elevator moving towards a call in its direction, (N + 1) - d if the
+    call is in the opposite direction, and 1 for an elevator moving away from the call. The
+    controllers' optional weightings are applied to the elevators moving towards the call.
+
+    Args:
+        elevators: controlled elevators
+        calls: FloorQueue of each call (a call may be repeated, ex: for different wait times)
+        num_floors: number of floors in the building (N + 1)
+        sector_bounds: (optional) divide each score by 1 + the distance (in floors) from the call
+                       to the elevator's sector for the call's direction. Array of the first and
+                       last floor index of the sectors, indexed [first/last][up/down][elevator]
+        wait_times: (optional) how long each call has waited, scores are multiplied by
+                    (wait / settings.MAX_WAIT)^2 once it's over settings.MAX_WAIT
+
+    Ret:
+        (calls x elevators) numpy array of figures of suitability
+    """
+    car_floors = np.array([i.curr_floor.index for i in elevators])
+    car_dirs = np.array([DIRECTION_SIGNS[i.direction] for i in elevators])
+    call_floors = np.array([i.floor.index for i in calls])[:, None]
+    call_dirs = np.array([DIRECTION_SIGNS[i.direction] for i in calls])[:, None]
+
+    # elevators moving towards the call, base score, -1 if the call is in the opposite direction
+    offset = call_floors - car_floors
+    towards = np.sign(offset) == car_dirs
+    fos = num_floors + 1 - np.abs(offset) - (call_dirs != car_dirs)
+
+    if sector_bounds is not None:
+        # sectors are contiguous, the distance to a sector is the distance to its nearest end (0
+        # inside of it)
+        sector_idx = (call_dirs[:, 0] == -1).astype(np.intp)
+        denom = np.maximum(
+            np.maximum(sector_bounds[0][sector_idx] - call_floors,
+                       call_floors - sector_bounds[1][sector_idx]),
+            0)
+        fos = fos / (1 + denom)
+
+    if wait_times is not None:
+        diff = np.array(wait_times, dtype=np.float64)[:, None]
+        weight = diff / settings.MAX_WAIT
+        fos = np.where(diff > settings.MAX_WAIT, fos * weight * weight, fos)
+
+    return np.where(towards, fos, 1)
+
+def best_elevators(elevators, calls, num_floors, sector_bounds=None, wait_times=None):
+    """index of the elevator with the greatest figure of suitability for each call
+
+    Ties go to the first elevator. Small problems (fewer than VECTORIZE_MIN_SCORES scores) are
+    scored one by one, where numpy's per-call overhead would outweigh the vectorized arithmetic;
+    both ways do the same arithmetic, so they always agree. See figures_of_suitability for the
+    arguments.
+
+    Ret:
+        list of elevator indices, one per call
+    """
+    if len(calls) * len(elevators) >= VECTORIZE_MIN_SCORES:
+        return figures_of_suitability(
+            elevators, calls, num_floors, sector_bounds, wait_times).argmax(axis=1).tolist()
+
+    car_floors = [i.curr_floor.index for i in elevators]
+    car_dirs = [DIRECTION_SIGNS[i.direction] for i in elevators]
+    bounds = sector_bounds.tolist() if sector_bounds is not None else None
+    best = []
+    for row, call in enumerate(calls):
+        call_floor = call.floor.index
+        call_dir = DIRECTION_SIGNS[call.direction]
+        weight = None
+        if wait_times is not None and wait_times[row] > settings.MAX_WAIT:
+            weight = wait_times[row] / settings.MAX_WAIT
+
+        fos = []
+        for idx, car_floor in enumerate(car_floors):
+            offset = call_floor - car_floor
+            if (offset > 0) - (offset < 0) != car_dirs[idx]:
+                fos.append(1)
+                continue
+            score = num_floors + 1 - abs(offset) - (call_dir != car_dirs[idx])
+            if bounds is not None:
+                sector = 0 if call_dir == 1 else 1
+                denom = max(
+                    bounds[0][sector][idx] - call_floor, call_floor - bounds[1][sector][idx], 0)
+                score = score / (1 + denom)
+            if weight is not None:
+                score = score * weight * weight
+            fos.append(score)
+        best.append(fos.index(max(fos)))
+    return best
+
 class NearestCarElevatorController(ElevatorController):
     """
     This controller implements the Nearest Car First algorithm
@@ -404,71 +795,27 @@ class NearestCarElevatorController(ElevatorController):
     def __init__(self, *args, **kwargs):
         super(self.__class__, self).__init__(*args, **kwargs)
 
-    #return the closest destination in the current direction
-    def get_next_dest(self, elevator, ch_dir=True):
-        # remove current floor from destination queue
+    def update_dests(self, elevator):
+        """Add the floors assigned to each elevator to its destination queue (the elevator asking
+        is done with its current floor)"""
         if elevator.curr_floor in elevator.destination_queue:
             elevator.destination_queue.remove(elevator.curr_floor)
 
-        self.update_dests()
-
-        # find the closest passenger destination in the same direction
-        closest_pass_dest = min(
-            [i.destination for i
-             in elevator.passengers
-             if elevator.curr_floor.dir_to(i.destination) == elevator.direction],
-            key=lambda x: abs(x - elevator.curr_floor),
-            default=None)
-
-        # find the closest pickup in the pickup queue
-        closest_caller_dest = min(
-            [i for i
-             in elevator.destination_queue
-             if elevator.curr_floor.dir_to(i) == elevator.direction],
-            key=lambda x: abs(x - elevator.curr_floor),
-            default=None)
-
-        # get the closest destination (or None if neither destination exists)
-        next_dest = min(
-            [i for i in [closest_pass_dest, closest_caller_dest] if i is not None],
-            key=lambda x: abs(elevator.curr_floor - x),
-            default=None)
-
-        # if neither destinatione exists, change direction and try again
-        if next_dest is None and ch_dir:
-            elevator.change_direction()
-
-            # prevent an infinite recursion by passing ch_dir=False
-            return self.get_next_dest(elevator, ch_dir=False)
-
-        return next_dest
-
-    def update_dests(self):
-        """Update the destinations of all elevators based on calculated scores"""
-        fos = [None for _ in range(len(self.elevators))] #figures of suitability for each elevator
-        for arrival in self._building.get_all_arrivals():
-            for idx, elevator in enumerate(self.elevators):
-                # FS = 1 if elevator isn't moving towards the call
-                if not elevator.direction == elevator.curr_floor.dir_to(arrival[1].origin):
-                    fos[idx] = 1
-                    continue
-
-                # base fs score
-                fos[idx] = (len(self._building.floor_order)
-                            + 1 - abs(arrival[1].origin - elevator.curr_floor))
-
-                # if the person is going in the opposite direction of the elevator, fs - 1
-                if not elevator.direction == arrival[1].origin.dir_to(arrival[1].destination):
-                    fos[idx] -= 1
-
-            #find the greatest figure of suitability for this arrival
-            max_idx = fos.index(max(fos))
+        for car, floors in self.assignments().items():
+            for floor in floors:
+                if floor not in car.destination_queue:
+                    car.destination_queue.append(floor)
 
-            #add this floor to the destination queue of the best elevator
-            if arrival[1].origin not in self.elevators[max_idx].destination_queue:
-                self.elevators[max_idx].destination_queue.append(arrival[1].origin)
+    def dispatch(self, calls):
+        """Send each call to the elevator with the greatest figure of suitability"""
+        if not calls:
+            return []
 
-            # self._building.remove(arrival) #we're finished with this arrival
+        #find the greatest figure of suitability for each call
+        return [
+            (call, self.elevators[max_idx]) for call, max_idx in zip(
+                calls,
+                best_elevators(self.elevators, calls, len(self._building.floor_order)))]
 
 class FixedSectorsElevatorController(ElevatorController):
     """This controller implements the Fixed Sector algorithm
@@ -479,93 +826,22 @@ class FixedSectorsElevatorController(ElevatorController):
     """
 
     def __init__(self, *args, **kwargs):
-        super(self.__class__, self).__init__(*args, **kwargs)
+        super().__init__(*args, **kwargs)
         #NOTE: SECTORS MOVED TO BEING SET IN TEST/CALL FILE
+        self._sector_bounds = None # first/last floor index of each sector (see set_sector)
 
-    #return the closest destination in the current direction
-    def get_next_dest(self, elevator, ch_dir=True):
-        # remove current floor from destination queue
-        if elevator.curr_floor in elevator.destination_queue:
-            elevator.destination_queue.remove(elevator.curr_floor)
+    def dispatch(self, calls):
+        """Send each call to the elevator with the greatest figure of suitability"""
+        if not calls:
+            return []
 
-        elevator.destination_queue = []
+        # weight the suitability according to how far away each call is from the sectors
+        best = best_elevators(
+            self.elevators, calls, len(self._building.floor_order),
+            sector_bounds=self._sector_bounds)
 
-        self.update_dests()
-
-        # find the closest passenger destination in the same direction
-        closest_pass_dest = min(
-            [i.destination for i
-             in elevator.passengers
-             if elevator.curr_floor.dir_to(i.destination) == elevator.direction],
-            key=lambda x: abs(x - elevator.curr_floor),
-            default=None)
-
-        # find the closest pickup in the pickup queue
-        closest_caller_dest = min(
-            [i for i
-             in elevator.destination_queue
-             if elevator.curr_floor.dir_to(i) == elevator.direction],
-            key=lambda x: abs(x - elevator.curr_floor),
-            default=None)
-
-        # get the closest destination (or None if neither destination exists)
-        next_dest = min(
-            [i for i in [closest_pass_dest, closest_caller_dest] if i is not None],
-            key=lambda x: abs(elevator.curr_floor - x),
-            default=None)
-
-        # if neither destinatione exists, change direction and try again
-        if next_dest is None and ch_dir:
-            elevator.change_direction()
-
-            # prevent an infinite recursion by passing ch_dir=False
-            return self.get_next_dest(elevator, ch_dir=False)
-
-        return next_dest
-
-    def update_dests(self):
-        """Update the destinations of all elevators based on calculated scores"""
-        fos = [None for _ in range(len(self.elevators))] #figures of suitability for each elevator
-
-        for arrival in self._building.get_all_arrivals():
-            for idx, elevator in enumerate(self.elevators):
-                # FS = 1 if elevator isn't moving towards the call
-                if not elevator.direction == elevator.curr_floor.dir_to(arrival[1].origin):
-                    fos[idx] = 1
-                    continue
-
-                # base fs score
-                fos[idx] = (len(self._building.floor_order)
-                            + 1 - abs(arrival[1].origin - elevator.curr_floor))
-
-                # if the person is going in the opposite direction of the elevator, fs - 1
-                if not elevator.direction == arrival[1].origin.dir_to(arrival[1].destination):
-                    fos[idx] -= 1
-
-                # weight the suitability according to how far away it is from the sector
-                arr_floor = arrival[1].origin
-                if arr_floor.dir_to(arrival[1].destination) == "up":
-                    if arr_floor in elevator.up_sector:
-                        denom = 0
-                    else:
-                        denom = min(
-                            abs(arr_floor-min(elevator.up_sector)),
-                            abs(arr_floor-max(elevator.up_sector)))
-                else:
-                    if arr_floor in elevator.down_sector:
-                        denom = 0
-                    else:
-                        denom = min(
-                            abs(arr_floor-min(elevator.down_sector)),
-                            abs(arr_floor-max(elevator.down_sector)))
-
-                fos[idx] /= (1+denom)
-
-            #find the greatest figure of suitability for this arrival
-            max_idx = fos.index(max(fos))
-
-            #add this floor to the destination queue of the best elevator
-            self.elevators[max_idx].destination_queue.append(arrival[1].origin)
+        #find the greatest figure of suitability for each call
+        return [(call, self.elevators[max_idx]) for call, max_idx in zip(calls, best)]
 
     def set_sector(self, elevator_num, up_sector, down_sector):
         """set the sectors of the elevators
@@ -578,16 +854,26 @@ class FixedSectorsElevatorController(ElevatorController):
         self.elevators[elevator_num].up_sector = [
             self._building.floor[self._building.floor_order[i]]
             for i in range(
-                self._building.floor_order.index(up_sector[0]),
-                self._building.floor_order.index(up_sector[1]))]
+                self._building.floor[up_sector[0]].index,
+                self._building.floor[up_sector[1]].index)]
         self.elevators[elevator_num].down_sector = [
             self._building.floor[self._building.floor_order[i]]
             for i in range(
-                self._building.floor_order.index(down_sector[0]),
-                self._building.floor_order.index(down_sector[1]))]
+                self._building.floor[down_sector[0]].index,
+                self._building.floor[down_sector[1]].index)]
+
+        # first and last floor index of the sectors, indexed [first/last][up/down][elevator]
+        if self._sector_bounds is None or self._sector_bounds.shape[2] != len(self.elevators):
+            self._sector_bounds = np.zeros((2, 2, len(self.elevators)), dtype=np.int64)
+        elevator = self.elevators[elevator_num]
+        for direction, sector in enumerate([elevator.up_sector, elevator.down_sector]):
+            self._sector_bounds[0, direction, elevator_num] = sector[0].index
+            self._sector_bounds[1, direction, elevator_num] = sector[-1].index
+        self._assignments_key = None
+        self._signatures = {}
 
 
-class FixedSectorsTimePriorityElevatorController(ElevatorController):
+class FixedSectorsTimePriorityElevatorController(FixedSectorsElevatorController):
     """This controller implements the Fixed Sector algorithm
     with TIME priority
 
@@ -596,115 +882,37 @@ class FixedSectorsTimePriorityElevatorController(ElevatorController):
 
     Additionally, priority for a floor increases as "time" increases
 
+    The sectors are set the same way (see FixedSectorsElevatorController.set_sector).
     """
-    def __init__(self, *args, **kwargs):
-        super(self.__class__, self).__init__(*args, **kwargs)
-        #NOTE: SECTORS MOVED TO BEING SET IN TEST/CALL FILE
 
-    #return the closest destination in the current direction
-    def get_next_dest(self, elevator, ch_dir=True):
-        # remove current floor from destination queue
-        if elevator.curr_floor in elevator.destination_queue:
-            elevator.destination_queue.remove(elevator.curr_floor)
-
-        elevator.destination_queue = []
-
-        self.update_dests()
-
-        # find the closest passenger destination in the same direction
-        closest_pass_dest = min(
-            [i.destination for i
-             in elevator.passengers
-             if elevator.curr_floor.dir_to(i.destination) == elevator.direction],
-            key=lambda x: abs(x - elevator.curr_floor),
-            default=None)
-
-        # find the closest pickup in the pickup queue
-        closest_caller_dest = min(
-            [i for i
-             in elevator.destination_queue
-             if elevator.curr_floor.dir_to(i) == elevator.direction],
-            key=lambda x: abs(x - elevator.curr_floor),
-            default=None)
-
-        # get the closest destination (or None if neither destination exists)
-        next_dest = min(
-            [i for i in [closest_pass_dest, closest_caller_dest] if i is not None],
-            key=lambda x: abs(elevator.curr_floor - x),
-            default=None)
-
-        # if neither destinatione exists, change direction and try again
-        if next_dest is None and ch_dir:
-            elevator.change_direction()
-
-            # prevent an infinite recursion by passing ch_dir=False
-            return self.get_next_dest(elevator, ch_dir=False)
-
-        return next_dest
-
-    def update_dests(self):
-        """Update the destinations of all elevators based on calculated scores"""
-        fos = [None for _ in range(len(self.elevators))] #figures of suitability for each elevator
-        for arrival in self._building.get_all_arrivals():
-            for idx, elevator in enumerate(self.elevators):
-                # FS = 1 if elevator isn't moving towards the call
-                if not elevator.direction == elevator.curr_floor.dir_to(arrival[1].origin):
-                    fos[idx] = 1
-                    continue
-
-                # base fs score
-                fos[idx] = (len(self._building.floor_order)
-                            + 1 - abs(arrival[1].origin - elevator.curr_floor))
-
-                # if the person is going in the opposite direction of the elevator, fs - 1
-                if not elevator.direction == arrival[1].origin.dir_to(arrival[1].destination):
-                    fos[idx] -= 1
-
-                # weight the suitability according to how far away it is from the sector
-                arr_floor = arrival[1].origin
-                if arr_floor.dir_to(arrival[1].destination) == "up":
-                    if arr_floor in elevator.up_sector:
-                        denom = 0
-                    else:
-                        denom = min(
-                            abs(arr_floor-min(elevator.up_sector)),
-                            abs(arr_floor-max(elevator.up_sector)))
-                else:
-                    if arr_floor in elevator.down_sector:
-                        denom = 0
-                    else:
-                        denom = min(
-                            abs(arr_floor-min(elevator.down_sector)),
-                            abs(arr_floor-max(elevator.down_sector)))
-                fos[idx] /= (1+denom)
-
-                #Add weighting based on time
-                diff = settings.CURR_TIME - arrival[0]
-                if diff > settings.MAX_WAIT:
-                    diff = diff/settings.MAX_WAIT
-                    fos[idx] = fos[idx] * diff * diff
-
-            #find the greatest figure of suitability for this arrival
-            max_idx = fos.index(max(fos))
-
-            #add this floor to the destination queue of the best elevator
-            self.elevators[max_idx].destination_queue.append(arrival[1].origin)
-
-    def set_sector(self, elevator_num, up_sector, down_sector):
-        """set the sectors of the elevators
-
-        Args:
-            elevator_num: which elevator to set the sectors of
-            up_sector: end points of floors included in the sector ex: ['B', '5']
-            down_sector: end points of floors included in the sector ex: ['B', '5']
-        """
-        self.elevators[elevator_num].up_sector = [
-            self._building.floor[self._building.floor_order[i]]
-            for i in range(
-                self._building.floor_order.index(up_sector[0]),
-                self._building.floor_order.index(up_sector[1]))]
-        self.elevators[elevator_num].down_sector = [
-            self._building.floor[self._building.floor_order[i]]
-            for i in range(
-                self._building.floor_order.index(down_sector[0]),
-                self._building.floor_order.index(down_sector[1]))]
+    # the time weighting starts at MAX_WAIT, and has quadrupled by SUPER_MAX_WAIT
+    WAIT_THRESHOLDS = (settings.MAX_WAIT, settings.SUPER_MAX_WAIT)
+
+    def assignment_key(self):
+        """the assignment also depends on how long everyone has been waiting"""
+        return (
+            self._building.queue_version,
+            self._sim.curr_time,
+            ElevatorController.assignment_key(self))
+
+    def dispatch(self, calls):
+        """Send each arrival to the elevator with the greatest figure of suitability"""
+        # everyone waiting in a call scores the same apart from the time weighting, which only
+        # grows with wait time, so the newest and oldest arrivals cover every elevator the call's
+        # arrivals would be sent to
+        arrivals = []
+        wait_times = []
+        for call in calls:
+            for arrival_time in set([call.newest()[0], call.oldest()[0]]):
+                arrivals.append(call)
+                wait_times.append(self._sim.curr_time - arrival_time)
+        if not arrivals:
+            return []
+
+        # weight the suitability according to the sectors and how long each arrival has waited
+        best = best_elevators(
+            self.elevators, arrivals, len(self._building.floor_order),
+            sector_bounds=self._sector_bounds, wait_times=wait_times)
+
+        #find the greatest figure of suitability for each arrival
+        return [(call, self.elevators[max_idx]) for call, max_idx in zip(arrivals, best)]
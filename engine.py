@@ -0,0 +1,311 @@
+"""discrete event engine: future event queue and the simulation that runs it"""
+
+# standard imports
+import bisect
+import heapq
+import pickle
+
+# local imports
+from person import PersonTable
+
+
+class EventQueue:
+    """future event queue backed by a plain binary heap
+
+    The simulation is single threaded, so there is no need for the locking done by
+    queue.PriorityQueue. Each entry carries a monotonically increasing sequence number which
+    breaks ties between simultaneous events (first scheduled, first run), so the scheduled objects
+    themselves are never compared.
+
+    Streams of events known up front (ex: a day of arrivals, see add_stream) are not copied into
+    the heap, they're merged in as their events come up. The heap only holds the few events
+    scheduled as the simulation runs (ex: the elevators' next steps), and the clock jumps straight
+    from one event to the next however long the building stays quiet in between.
+
+    structure of items
+        (time_of_event, object, new_state)
+    """
+
+    def __init__(self):
+        self._heap = [] # (time_of_event, seq, object, new_state)
+        self._streams = [] # [times, object, states, position] of each stream (see add_stream)
+        self._stream = None # stream with the earliest next event (None once they're all done)
+        self._stream_time = None # time of that event
+        self._seq = 0 # sequence number of the last event scheduled
+
+    def put(self, time, obj, state):
+        """schedule an event
+
+        Args:
+            time: time the event occurs at
+            obj: object whose update_state(state) is called when the event occurs
+            state: new state passed to obj.update_state
+        """
+        self._seq += 1
+        heapq.heappush(self._heap, (time, self._seq, obj, state))
+
+    def extend(self, events):
+        """schedule many events at once (ex: a whole day of arrivals)
+
+        Entries are appended and the heap is rebuilt with a single heapify, which is linear in the
+        size of the queue instead of O(n log n) for n individual puts.
+
+        Args:
+            events: iterable of (time, object, new_state)
+        """
+        start = len(self._heap)
+        self._heap.extend(
+            (time, seq, obj, state)
+            for seq, (time, obj, state) in enumerate(events, self._seq + 1))
+        self._seq += len(self._heap) - start
+        heapq.heapify(self._heap)
+
+    def add_stream(self, times, obj, states=None):
+        """schedule a stream of events at once (ex: a whole day of arrivals)
+
+        The stream's events are merged with the other events as they come up, they go first when
+        they're at the same time as events scheduled with put or extend (streams are scheduled
+        before the simulation starts), and in the order the streams were added between streams.
+
+        Args:
+            times: list of the times of the events (in order)
+            obj: object whose update_state(state) is called for each event
+            states: (optional) list of the state passed for each event, defaults to its index
+        """
+        self._streams.append([times, obj, states, 0])
+        self._next_stream()
+
+    def _next_stream(self):
+        """finds the stream with the earliest next event (dropping the streams that are done)"""
+        self._streams = [i for i in self._streams if i[3] < len(i[0])]
+        self._stream = None
+        for stream in self._streams:
+            if self._stream is None or stream[0][stream[3]] < self._stream_time:
+                self._stream = stream
+                self._stream_time = stream[0][stream[3]]
+
+    def _stream_first(self):
+        """whether or not the next event comes from a stream"""
+        if self._stream is None:
+            return False
+        return not self._heap or self._stream_time <= self._heap[0][0]
+
+    def get(self):
+        """remove and return the next event
+
+        Returns:
+            (time_of_event, object, new_state)
+        """
+        if self._stream_first():
+            stream = self._stream
+            times, obj, states, pos = stream
+            stream[3] = pos + 1
+            if stream[3] < len(times) and len(self._streams) == 1:
+                self._stream_time = times[pos + 1]
+            else:
+                self._next_stream()
+            return times[pos], obj, pos if states is None else states[pos]
+        time, _, obj, state = heapq.heappop(self._heap)
+        return time, obj, state
+
+    def peek(self):
+        """return the next event without removing it (None if the queue is empty)"""
+        if self._stream_first():
+            times, obj, states, pos = self._stream
+            return times[pos], obj, pos if states is None else states[pos]
+        if not self._heap:
+            return None
+        time, _, obj, state = self._heap[0]
+        return time, obj, state
+
+    def clear(self):
+        """remove all scheduled events"""
+        self._heap = []
+        self._streams = []
+        self._stream = None
+
+    def empty(self):
+        """returns whether or not there are any events left"""
+        return not self._heap and self._stream is None
+
+    def __len__(self):
+        return len(self._heap) + sum(len(i[0]) - i[3] for i in self._streams)
+
+
+class Simulation:
+    """state of one simulation run: the clock, future event queue, building, elevators, people
+    (see person.PersonTable) and loggers
+
+    The simulation also keeps a registry of its idle elevators, grouped by the dispatcher that
+    wakes them up when someone queues (see person_queued).
+
+    Nothing about a run is kept in module globals, so several simulations can exist (or run in
+    different threads) in one process. Models hold a reference to the simulation they belong to
+    and schedule their own events on sim.feq.
+
+    Usage:
+        sim = Simulation(building, person_logger=person_logger, day=0)
+        arr_gen.schedule(sim)
+        for _ in range(6):
+            elevators.ScanElevator(sim)
+        sim.run()
+
+    A simulation can be saved and restored (see snapshot), or forked into branches:
+        sim.run(until=8 * 3600)
+        branch = sim.fork()
+        branch.run()
+    """
+
+    def __init__(self, building, person_logger=None, metrics=None, day=0):
+        """Simulation Constructor
+
+        Args:
+            building: building being simulated
+            person_logger: (optional) logger people write their state changes to
+            metrics: (optional) metrics.MetricsCollector people and elevators report to
+            day: index of the day being simulated (logged with each event)
+        """
+        self.building = building
+        self.person_logger = person_logger
+        self.metrics = metrics
+        self.feq = EventQueue()
+        self.curr_day = day
+        self.curr_time = 0
+        self.elevators = []
+        self.people = PersonTable(building)
+        self._idle = {} # dispatcher -> its idle elevators, sorted by id (see set_idle)
+
+    def add_elevator(self, elevator):
+        """adds an elevator to the simulation
+
+        Elevators start out idle. An elevator is woken up by its dispatcher (elevator.dispatcher,
+        None for independent elevators, see person_queued).
+
+        Args:
+            elevator: elevator to add
+
+        Returns:
+            id for the elevator (unique within this simulation)
+        """
+        self.elevators.append(elevator)
+        self._idle.setdefault(elevator.dispatcher, []).append(elevator)
+        return len(self.elevators) - 1
+
+    def set_idle(self, elevator, idle):
+        """records that an elevator became idle, or stopped being idle (O(log elevators) search)
+
+        Args:
+            elevator: elevator whose state changed
+            idle: whether or not the elevator is now idle
+        """
+        idle_elevators = self._idle[elevator.dispatcher]
+        if idle:
+            bisect.insort(idle_elevators, elevator)
+        else:
+            del idle_elevators[bisect.bisect_left(idle_elevators, elevator)]
+
+    def idle_elevators(self, dispatcher=None):
+        """returns the idle elevators woken up by <dispatcher>, sorted by id"""
+        return list(self._idle.get(dispatcher, ()))
+
+    def person_queued(self, person):
+        """wakes up the idle elevators when someone queues
+
+        Independent elevators each answer every call, so all the idle ones are woken up. Controlled
+        elevators are left to their dispatcher (dispatcher.call_placed(person)), which polls all of
+        its idle elevators. Busy elevators are skipped, they pick their next destination when they
+        stop.
+
+        Args:
+            person: person who queued
+        """
+        for dispatcher, idle_elevators in self._idle.items():
+            if not idle_elevators:
+                continue
+            if dispatcher is None:
+                for elevator in list(idle_elevators):
+                    elevator.update_state()
+            else:
+                dispatcher.call_placed(person)
+
+    def snapshot(self, detached=False):
+        """returns the full state of the simulation as bytes, ex: to checkpoint a long run
+
+        Everything the simulation references is included: the clock, the event queue (and the
+        arrivals still to come), the building and its floor queues, the elevators and their
+        passengers, the people, the metrics and the random number generators. The person log's
+        buffered rows are written out first. When the snapshot is restored the logger reconnects
+        to its database and deletes the rows written after the snapshot was taken, so a run
+        restarted from a checkpoint logs everything exactly once.
+
+        Args:
+            detached: (optional) leave out the person logger and the metrics, the restored
+                      simulation has neither (ex: a branch that's only looked at)
+
+        Ret:
+            bytes to pass to Simulation.restore
+        """
+        if detached:
+            original = self.person_logger, self.metrics
+            self.person_logger = self.metrics = None
+            try:
+                return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+            finally:
+                self.person_logger, self.metrics = original
+
+        if self.person_logger is not None:
+            self.person_logger.flush()
+        return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def restore(snapshot):
+        """recreates a simulation from a snapshot (see snapshot), run resumes it (its person log is
+        rolled back to the snapshot)"""
+        return pickle.loads(snapshot)
+
+    def fork(self, person_logger=None):
+        """returns an independent copy of the simulation, ex: to branch off of a warm state
+
+        Each branch can be changed (ex: a different sector layout, see
+        elevators.ElevatorController.set_sector) and run on its own, without simulating what
+        came before the fork again. A branch has its own copy of the metrics collected so far,
+        and doesn't write to the simulation's person log.
+
+        Args:
+            person_logger: (optional) logger the branch's people write their state changes to
+
+        Ret:
+            Simulation
+        """
+        original_logger = self.person_logger
+        self.person_logger = None
+        try:
+            branch = pickle.loads(pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL))
+        finally:
+            self.person_logger = original_logger
+        branch.person_logger = person_logger
+        return branch
+
+    def quiescent(self):
+        """returns whether or not the simulation has nothing left to do: nobody else is going to
+        arrive, and nothing is scheduled (no elevator is on its way anywhere)"""
+        return self.feq.empty()
+
+    def run(self, until=None):
+        """pop events in time order, advance the clock and apply each state change
+
+        Args:
+            until: (optional) stop before the first event after this time, the simulation can be
+                   resumed by calling run again
+        """
+        feq = self.feq
+        if until is None:
+            while not feq.empty():
+                curr_time, obj, state = feq.get()
+                self.curr_time = curr_time
+                obj.update_state(state)
+        else:
+            while not feq.empty() and feq.peek()[0] <= until:
+                curr_time, obj, state = feq.get()
+                self.curr_time = curr_time
+                obj.update_state(state)
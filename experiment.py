@@ -0,0 +1,291 @@
+"""experiment specifications and the entry point that runs them
+
+An experiment is described by an ExperimentSpec: the building's floors, the elevator algorithm,
+how many cars it runs with (and their capacity and sectors), the days simulated, and where results
+are written. Specs can be created in python or loaded from a JSON, TOML or YAML file.
+
+Example (JSON):
+    [
+        {"name": "look", "algorithm": "look", "cars": 6},
+        {"name": "FS0", "algorithm": "sector", "cars": 2,
+         "sectors": [[["G", "1"], ["1", "3"]], [["SB", "11"], ["B", "12"]]]}
+    ]
+
+TOML files list specs as [[experiments]] tables.
+
+Usage:
+    for spec in load_specs("experiments.json"):
+        run_experiment(spec)
+"""
+
+# standard imports
+from dataclasses import dataclass, field, replace
+import json
+import os
+
+# third party imports
+import numpy as np
+
+# local imports
+import settings
+from building import Building
+from engine import Simulation
+from metrics import MetricsCollector
+from person import ArrivalGenerator
+import elevators
+import logger
+import rollout
+import stats as sim_stats
+
+BASE_DIR = "experiments"
+FLOORS = ['SB', 'B', 'G', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12']
+DAYS = ["M", "Tu", "W", "Th", "F"]
+
+# algorithm name -> elevator class (single elevator algorithms) or controller class
+ALGORITHMS = {
+    "scan": elevators.ScanElevator,
+    "look": elevators.LookElevator,
+    "nearest": elevators.NearestCarElevatorController,
+    "sector": elevators.FixedSectorsElevatorController,
+    "sector_time": elevators.FixedSectorsTimePriorityElevatorController,
+    "rollout": rollout.RolloutElevatorController,
+}
+
+
+@dataclass
+class ExperimentSpec:
+    """describes an experiment
+
+    Attributes:
+        name: name of the experiment
+        algorithm: elevator algorithm (key of ALGORITHMS)
+        floors: floor names, bottom to top
+        cars: number of elevators
+        capacity: max number of passengers per elevator
+        sectors: [up sector, down sector] for each elevator of the sector algorithms (required
+                 by them, not allowed otherwise), each sector is its end points ex:
+                 [['G', '1'], ['1', '3']]
+        incremental: (optional) whether the multi-elevator algorithms dispatch hall calls
+                     incrementally (see elevators.ElevatorController), defaults to
+                     settings.INCREMENTAL_DISPATCH (the look-ahead algorithm always does)
+        days: days simulated
+        limit: (optional) only simulate the first <limit> arrivals of each day
+        seeds: one entry per replication of each day: None simulates the day's saved arrivals, a
+               number simulates arrivals generated with that seed
+        output_dir: directory results are written to (defaults to BASE_DIR/<name>)
+        replications: (optional) Monte Carlo mode, max number of replications to run, each with
+                      an independent random stream spawned from <seed> (replaces seeds)
+        seed: (optional) root seed the replications' streams are spawned from (random if None)
+        ci_half_width: (optional) stop replicating once the 95% confidence intervals of the
+                       average wait time and time in system are narrower than +/- this (seconds)
+    """
+
+    name: str
+    algorithm: str
+    floors: list = field(default_factory=lambda: list(FLOORS))
+    cars: int = 6
+    capacity: int = settings.DEFAULT_CAPACITY
+    sectors: list = None
+    incremental: bool = None
+    days: list = field(default_factory=lambda: list(DAYS))
+    limit: int = None
+    seeds: list = field(default_factory=lambda: [None])
+    output_dir: str = None
+    replications: int = None
+    seed: int = None
+    ci_half_width: float = None
+
+    def __post_init__(self):
+        if self.algorithm not in ALGORITHMS:
+            raise ValueError("unknown algorithm {!r} (expected one of {})".format(
+                self.algorithm, ", ".join(ALGORITHMS)))
+        if hasattr(ALGORITHMS[self.algorithm], "set_sector") and self.sectors is None:
+            raise ValueError("algorithm {!r} needs sectors".format(self.algorithm))
+        if self.sectors is not None:
+            if not hasattr(ALGORITHMS[self.algorithm], "set_sector"):
+                raise ValueError("algorithm {!r} doesn't use sectors".format(self.algorithm))
+            if len(self.sectors) != self.cars:
+                raise ValueError("expected sectors for {} cars, got {}".format(
+                    self.cars, len(self.sectors)))
+        if self.incremental and not issubclass(
+                ALGORITHMS[self.algorithm], elevators.ElevatorController):
+            raise ValueError("algorithm {!r} doesn't dispatch hall calls".format(self.algorithm))
+        if self.replications is not None and self.replications < 2:
+            raise ValueError("Monte Carlo mode needs at least 2 replications")
+        if self.output_dir is None:
+            self.output_dir = os.path.join(BASE_DIR, self.name)
+
+    def spawn_seeds(self):
+        """returns a copy of the spec that runs its Monte Carlo replications
+
+        Each replication gets its own numpy.random.SeedSequence, spawned from the root seed (the
+        root's entropy is kept, so a random root can be reproduced).
+        """
+        root = np.random.SeedSequence(self.seed)
+        return replace(self, seed=root.entropy, seeds=root.spawn(self.replications))
+
+    @property
+    def person_log_path(self):
+        """path of the experiment's person log"""
+        return os.path.join(self.output_dir, settings.LOG_DIR, settings.PERSON_LOG_FNAME)
+
+    @property
+    def stats_dir(self):
+        """directory the experiment's stats are written to"""
+        return os.path.join(self.output_dir, "stats")
+
+    def log_day(self, day_idx, replication):
+        """day logged for a day of a replication (unique across days and replications)"""
+        return replication * len(self.days) + day_idx
+
+    def spawn_elevators(self, sim):
+        """adds the experiment's elevators to a simulation"""
+        algorithm = ALGORITHMS[self.algorithm]
+        if issubclass(algorithm, elevators.ElevatorController):
+            if self.incremental is None:
+                controller = algorithm(sim)
+            else:
+                controller = algorithm(sim, incremental=self.incremental)
+            controller.spawn_elevators(self.cars, capacity=self.capacity)
+            for idx, (up_sector, down_sector) in enumerate(self.sectors or []):
+                controller.set_sector(idx, up_sector, down_sector)
+        else:
+            for _ in range(self.cars):
+                algorithm(sim, capacity=self.capacity)
+
+
+def load_specs(path):
+    """loads experiment specs from a file
+
+    The format is picked from the file's extension: .json, .toml (python 3.11+) or .yaml/.yml
+    (requires PyYAML). The file contains a list of specs, or a table with the list under
+    "experiments".
+
+    Args:
+        path: path to the file
+
+    Ret:
+        list of ExperimentSpec
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".json":
+        with open(path, 'r') as spec_file:
+            data = json.load(spec_file)
+    elif ext == ".toml":
+        try:
+            import tomllib
+        except ImportError as exc:
+            raise ValueError("reading TOML specs requires python 3.11 or later") from exc
+        with open(path, 'rb') as spec_file:
+            data = tomllib.load(spec_file)
+    elif ext in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as exc:
+            raise ValueError("reading YAML specs requires PyYAML") from exc
+        with open(path, 'r') as spec_file:
+            data = yaml.safe_load(spec_file)
+    else:
+        raise ValueError("unknown experiment spec format: {}".format(path))
+
+    if isinstance(data, dict):
+        data = data["experiments"]
+    return [ExperimentSpec(**i) for i in data]
+
+def arrivals_path(day):
+    """path of the saved arrivals for a day"""
+    return os.path.join(settings.ARRIVALS_DIR, "{}_arrivals.csv".format(day))
+
+def load_arrivals(building, day, seed):
+    """returns an ArrivalGenerator with the arrivals for one day
+
+    Args:
+        building: building the arrivals are for
+        day: day being simulated
+        seed: None for the day's saved arrivals (generated and saved if there aren't any yet), a
+              numpy.random.SeedSequence for arrivals generated from it (not cached, replications
+              are only simulated once), otherwise the seed arrivals are generated with (cached)
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        arr_gen = ArrivalGenerator(building, seed=seed)
+        arr_gen.gen_from_classes(file_path=settings.ARRIVALS_DATA_SET_CSV, days=[day])
+    elif seed is None:
+        arr_gen = ArrivalGenerator(building)
+        save_path = arrivals_path(day)
+        if not os.path.exists(save_path):
+            arr_gen.gen_from_classes(file_path=settings.ARRIVALS_DATA_SET_CSV, days=[day])
+            arr_gen.save(save_path)
+        arr_gen.load(save_path)
+    else:
+        arr_gen = ArrivalGenerator(building, seed=seed)
+        arr_gen.gen_cached(settings.ARRIVALS_DATA_SET_CSV, [day])
+    return arr_gen
+
+def setup_day(spec, building, day_idx, replication, person_logger=None, metrics=None):
+    """creates the simulation of one day of an experiment, ready to run
+
+    Args:
+        spec: ExperimentSpec being run
+        building: building to simulate (its floors must be spec.floors)
+        day_idx: index of the day in spec.days
+        replication: index of the replication (and its seed) in spec.seeds
+        person_logger: (optional) logger people write their state changes to
+        metrics: (optional) metrics.MetricsCollector people and elevators report to
+
+    Ret:
+        engine.Simulation with the day's arrivals scheduled and the experiment's elevators
+    """
+    seed = spec.seeds[replication]
+    if isinstance(seed, np.random.SeedSequence):
+        # independent stream for each day of the replication (same as seed.spawn would give)
+        seed = np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (day_idx,))
+    arr_gen = load_arrivals(building, spec.days[day_idx], seed)
+    sim = Simulation(
+        building, person_logger=person_logger, metrics=metrics,
+        day=spec.log_day(day_idx, replication))
+    arr_gen.schedule(sim, spec.limit)
+    spec.spawn_elevators(sim)
+    return sim
+
+def simulate_day(spec, building, day_idx, replication, person_logger=None, metrics=None):
+    """simulates one day of an experiment (see setup_day for the arguments)
+
+    Ret:
+        the finished engine.Simulation
+    """
+    sim = setup_day(spec, building, day_idx, replication, person_logger, metrics)
+    sim.run()
+    return sim
+
+def run_experiment(spec):
+    """runs every day and replication of an experiment (serially), then writes its stats
+
+    Stats come from the streamed metrics if settings.STREAM_METRICS is set, otherwise from the
+    person log.
+
+    Args:
+        spec: ExperimentSpec to run
+    """
+    person_logger = logger.create_person_logger(spec.person_log_path, remove_old=True, fast=True)
+    building = Building(spec.floors)
+    metrics = MetricsCollector(building) if settings.STREAM_METRICS else None
+
+    for replication in range(len(spec.seeds)):
+        for day_idx, day in enumerate(spec.days):
+            simulate_day(spec, building, day_idx, replication, person_logger, metrics)
+
+            # write out the rest of the day's logs
+            if person_logger is not None:
+                person_logger.flush()
+            print("Done with", day)
+
+    if person_logger is not None:
+        person_logger.close()
+
+    if metrics is not None:
+        metrics.write(spec.stats_dir)
+    else:
+        sim_stats.run_stats(
+            person_log_path=spec.person_log_path, stats_dir=spec.stats_dir,
+            floor_names=spec.floors)
+    print("done simulating", spec.name)
@@ -4,15 +4,36 @@ import sqlite3
 import os
 import errno
 
+import settings
+
 class Logger:
-    """a base class for loggers"""
+    """a base class for loggers
+
+    Rows are buffered in memory and written with executemany (the INSERT_STMT uses bound
+    parameters, so sqlite can reuse the prepared statement). The buffer is flushed in a single
+    transaction whenever it reaches batch_size rows, and whenever flush() is called (ex: at the
+    end of each simulated day).
+    """
 
+    TABLE = ""
     CREATE_TABLE_STMT = ""
     SELECT_ALL_STMT = ""
     INSERT_STMT = ""
 
-    def __init__(self, db_path, remove_old=False):
+    def __init__(self, db_path, remove_old=False, batch_size=settings.LOG_BATCH_SIZE, fast=False):
+        """Logger Constructor
+
+        Args:
+            db_path: path to the sqlite database
+            remove_old: whether or not to delete the database if it already exists
+            batch_size: number of rows buffered before they are written to the database
+            fast: use write-ahead logging and don't wait for writes to reach the disk. Much faster,
+                  but the database may be corrupted if the machine crashes mid-simulation.
+        """
         self.db_path = db_path
+        self.batch_size = batch_size
+        self.fast = fast
+        self._rows = []
 
         # remove old database
         if remove_old:
@@ -22,6 +43,10 @@ class Logger:
                 if err.errno != errno.ENOENT: # errno.ENOENT = no such file or directory
                     raise # re-raise exception if a different error occurred
 
+        self._connect()
+
+    def _connect(self):
+        """connect to the database (creating it if it doesn't exist yet)"""
         # create new database, or connect to existing
         if not os.path.isfile(self.db_path):
             # create directory tree
@@ -36,12 +61,57 @@ class Logger:
         else:
             self.conn = sqlite3.connect(self.db_path)
 
+        if self.fast:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=OFF")
+
+    def __getstate__(self):
+        """pickled without the database connection (ex: in a simulation snapshot, see
+        engine.Simulation.snapshot), it's reopened when unpickled
+
+        The number of rows written so far (the table's last rowid) is pickled along, rows written
+        after that are deleted when the logger is unpickled: a run restarted from a snapshot
+        doesn't log what happened after the snapshot twice.
+        """
+        state = self.__dict__.copy()
+        del state["conn"]
+        state["_last_rowid"] = self.conn.execute(
+            "SELECT COALESCE(MAX(rowid), 0) FROM {}".format(self.TABLE)).fetchone()[0]
+        return state
+
+    def __setstate__(self, state):
+        last_rowid = state.pop("_last_rowid")
+        self.__dict__.update(state)
+        self._connect()
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM {} WHERE rowid > ?".format(self.TABLE), (last_rowid,))
+
     def write_log(self, obj, day, time):
         """write states to log database"""
         raise NotImplementedError()
 
+    def _append(self, row):
+        """buffer a row, writing the buffer to the database once it is full"""
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """write all buffered rows to the database in one transaction"""
+        if self._rows:
+            with self.conn:
+                self.conn.executemany(self.__class__.INSERT_STMT, self._rows)
+            self._rows = []
+
+    def close(self):
+        """flush buffered rows and close the database connection"""
+        self.flush()
+        self.conn.close()
+
     def get_all(self):
         """return all rows"""
+        self.flush()
         cur = self.conn.cursor()
         cur.execute(self.__class__.SELECT_ALL_STMT)
         return cur.fetchall()
@@ -56,17 +126,23 @@ class Logger:
 
 
 class PersonLogger(Logger):
-    """logs states of people"""
+    """logs states of people
+
+    STATE is stored as the integer value of the Person.States member, ORIGIN and DEST as floor
+    indices (position in building.floor_order).
+    """
+
+    TABLE = "PERSON_LOGS"
 
     CREATE_TABLE_STMT = """
                             CREATE TABLE PERSON_LOGS (
                                PERSON_ID INT,
                                EVENT_DAY INT,
                                EVENT_TIME INT,
-                               STATE TEXT,
+                               STATE INT,
                                ELEVATOR_ID INT,
-                               ORIGIN TEXT,
-                               DEST TEXT
+                               ORIGIN INT,
+                               DEST INT
                             )"""
 
     INSERT_STMT = """
@@ -78,7 +154,7 @@ class PersonLogger(Logger):
                         ELEVATOR_ID,
                         ORIGIN,
                         DEST)
-                    VALUES ({}, {}, {}, '{}', {}, '{}', '{}')"""
+                    VALUES (?, ?, ?, ?, ?, ?, ?)"""
 
     SELECT_ALL_STMT = """
                         SELECT
@@ -96,25 +172,135 @@ class PersonLogger(Logger):
         super().__init__(*args, **kwargs)
 
     def write_log(self, person, day, time):
-        """write states to log database"""
-        if person.curr_elevator:
-            stmt = self.__class__.INSERT_STMT.format(
-                person.id,
-                day,
-                time,
-                person.state,
-                person.curr_elevator.id,
-                person.origin.building.floor_order.index(person.origin.name),
-                person.destination.building.floor_order.index(person.destination.name))
-        else:
-            stmt = self.__class__.INSERT_STMT.format(
-                person.id,
-                day,
-                time,
-                person.state,
-                -1,
-                person.origin.building.floor_order.index(person.origin.name),
-                person.destination.building.floor_order.index(person.destination.name))
-        self.conn.execute(stmt)
-        # Note: usually it would make sense to commit changes here, but it is much faster
-        #       if the commit is done after all simulation is finished
+        """buffer a state change to be written to the log database"""
+        self._append((
+            person.id,
+            day,
+            time,
+            person.state.value,
+            person.curr_elevator.id if person.curr_elevator else -1,
+            person.origin.index,
+            person.destination.index))
+
+
+class TripLogger(Logger):
+    """logs one row per trip instead of one row per state change
+
+    A row is written when a person reaches their destination (goes back to idle), using the
+    queued and boarded times the person keeps track of. This is a third of the rows written by the
+    PersonLogger, and stats can read trips directly instead of rebuilding them.
+    """
+
+    TABLE = "TRIPS"
+
+    CREATE_TABLE_STMT = """
+                            CREATE TABLE TRIPS (
+                               PERSON_ID INT,
+                               EVENT_DAY INT,
+                               ORIGIN INT,
+                               DEST INT,
+                               QUEUED_TIME REAL,
+                               BOARDED_TIME REAL,
+                               ALIGHTED_TIME REAL,
+                               ELEVATOR_ID INT
+                            )"""
+
+    INSERT_STMT = """
+                    INSERT INTO TRIPS (
+                        PERSON_ID,
+                        EVENT_DAY,
+                        ORIGIN,
+                        DEST,
+                        QUEUED_TIME,
+                        BOARDED_TIME,
+                        ALIGHTED_TIME,
+                        ELEVATOR_ID)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+
+    SELECT_ALL_STMT = """
+                        SELECT
+                            PERSON_ID,
+                            EVENT_DAY,
+                            ORIGIN,
+                            DEST,
+                            QUEUED_TIME,
+                            BOARDED_TIME,
+                            ALIGHTED_TIME,
+                            ELEVATOR_ID
+                        FROM
+                            TRIPS"""
+
+    def write_log(self, person, day, time):
+        """buffer a completed trip (ignores state changes other than reaching the destination)"""
+        if person.state != person.States.IDLE:
+            return
+
+        self._append((
+            person.id,
+            day,
+            person.origin.index,
+            person.destination.index,
+            person.queued_time,
+            person.boarded_time,
+            time,
+            person.curr_elevator.id if person.curr_elevator else -1))
+
+
+def create_person_logger(db_path, **kwargs):
+    """creates the logger for people, according to settings.LOG_PEOPLE and settings.LOG_TRIPS
+
+    Args:
+        db_path: path to the sqlite database
+        other: optional arguments passed to the logger's constructor
+
+    Ret:
+        None if settings.LOG_PEOPLE is off, TripLogger if settings.LOG_TRIPS is set,
+        PersonLogger otherwise
+    """
+    if not settings.LOG_PEOPLE:
+        return None
+    if settings.LOG_TRIPS:
+        return TripLogger(db_path, **kwargs)
+    return PersonLogger(db_path, **kwargs)
+
+def merge_logs(db_path, shard_paths, remove_shards=False):
+    """merges log databases (ex: shards written by parallel workers) into a new database
+
+    Each shard is attached to the new database and its tables are copied over with a single
+    INSERT ... SELECT, so rows never pass through python. Tables are created from the shards'
+    schemas as they are first seen.
+
+    Note: overwrites whatever is currently at <db_path>
+
+    Args:
+        db_path: path to the merged database
+        shard_paths: paths of the databases to merge, rows are copied in this order
+        remove_shards: whether or not to delete the shard databases once they are merged
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    dirs = os.path.dirname(db_path)
+    if not os.path.exists(dirs):
+        os.makedirs(dirs, exist_ok=True)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    for shard_path in shard_paths:
+        conn.execute("ATTACH DATABASE ? AS shard", (shard_path,))
+        with conn:
+            tables = conn.execute(
+                "SELECT name, sql FROM shard.sqlite_master WHERE type = 'table'").fetchall()
+            for name, create_stmt in tables:
+                exists = conn.execute(
+                    "SELECT COUNT(*) FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                    (name,)).fetchone()[0]
+                if not exists:
+                    conn.execute(create_stmt)
+                conn.execute("INSERT INTO main.{0} SELECT * FROM shard.{0}".format(name))
+        conn.execute("DETACH DATABASE shard")
+    conn.close()
+
+    if remove_shards:
+        for shard_path in shard_paths:
+            os.remove(shard_path)
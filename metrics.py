@@ -0,0 +1,322 @@
+"""online statistics, collected while the simulation runs
+
+Unlike stats.py, nothing here needs the person log database: every statistic is updated as people
+and elevators change state, using memory that doesn't grow with the number of people simulated.
+This makes it possible to run long simulations (or many of them) with logging turned off.
+
+Usage:
+    metrics = MetricsCollector(building)
+    sim = Simulation(building, metrics=metrics)
+    ... run simulation ...
+    metrics.write(stats_dir)
+"""
+
+# standard imports
+import bisect
+import math
+import os
+
+# third party imports
+import numpy as np
+
+# local imports
+import settings
+import stats as sim_stats
+
+
+# two-sided 95% critical values of Student's t distribution, by degrees of freedom (1-30), larger
+# samples use the normal approximation
+T_CRITICAL_95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+Z_CRITICAL_95 = 1.960
+
+
+def confidence_interval(values):
+    """mean, sample standard deviation and 95% confidence interval half-width of a sample
+
+    Args:
+        values: sequence of independent observations (ex: one average per replication)
+
+    Ret:
+        (mean, std, half_width), the std and half-width are nan for fewer than two values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 2:
+        return float(np.mean(values)) if len(values) else math.nan, math.nan, math.nan
+    std = float(np.std(values, ddof=1))
+    dof = len(values) - 1
+    crit = T_CRITICAL_95[dof - 1] if dof <= len(T_CRITICAL_95) else Z_CRITICAL_95
+    return float(np.mean(values)), std, crit * std / math.sqrt(len(values))
+
+
+class RunningStats:
+    """running count, mean and variance of a stream of values (Welford's algorithm)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0 # sum of squared differences from the mean
+
+    def add(self, value):
+        """add a value to the stream"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def variance(self):
+        """population variance of the values seen so far"""
+        if self.count == 0:
+            return math.nan
+        return self._m2 / self.count
+
+    def std(self):
+        """population standard deviation of the values seen so far"""
+        return math.sqrt(self.variance())
+
+
+class P2Quantile:
+    """streaming estimate of a single quantile using five markers
+
+    Implements the P-square algorithm (Jain & Chlamtac, 1985). The first five values are kept as
+    is, after that the markers' heights are adjusted with a piecewise-parabolic fit as values
+    arrive, so memory use is constant.
+    """
+
+    def __init__(self, quantile):
+        """P2Quantile Constructor
+
+        Args:
+            quantile: quantile to estimate, between 0 and 1 (ex: .9 for the 90th percentile)
+        """
+        self.quantile = quantile
+        self._heights = [] # marker heights
+        self._pos = [1, 2, 3, 4, 5] # actual marker positions
+        self._desired = [
+            1, 1 + 2*quantile, 1 + 4*quantile, 3 + 2*quantile, 5] # desired marker positions
+        self._incr = [0, quantile/2, quantile, (1 + quantile)/2, 1] # desired position increments
+
+    def add(self, value):
+        """add a value to the stream"""
+        heights = self._heights
+
+        # keep the first five observations
+        if len(heights) < 5:
+            bisect.insort(heights, value)
+            return
+
+        # find the cell the value falls in, extending the extremes if needed
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = bisect.bisect_right(heights, value) - 1
+
+        # shift the markers above the value
+        for i in range(cell + 1, 5):
+            self._pos[i] += 1
+        for i in range(5):
+            self._desired[i] += self._incr[i]
+
+        # adjust the heights of the middle markers if they are off their desired positions
+        pos = self._pos
+        for i in range(1, 4):
+            diff = self._desired[i] - pos[i]
+            if (diff >= 1 and pos[i + 1] - pos[i] > 1) or (diff <= -1 and pos[i - 1] - pos[i] < -1):
+                step = 1 if diff > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (
+                        (heights[i + step] - heights[i]) / (pos[i + step] - pos[i]))
+                heights[i] = height
+                pos[i] += step
+
+    def _parabolic(self, i, step):
+        """piecewise-parabolic prediction of marker i's height after moving it <step> positions"""
+        heights, pos = self._heights, self._pos
+        return heights[i] + step / (pos[i + 1] - pos[i - 1]) * (
+            (pos[i] - pos[i - 1] + step) * (heights[i + 1] - heights[i]) / (pos[i + 1] - pos[i])
+            + (pos[i + 1] - pos[i] - step) * (heights[i] - heights[i - 1]) / (pos[i] - pos[i - 1]))
+
+    def value(self):
+        """current estimate of the quantile (nan if no values have been added)"""
+        if not self._heights:
+            return math.nan
+        if self._pos[4] > 5: # more than five values, the middle marker is the estimate
+            return self._heights[2]
+        return float(np.percentile(self._heights, self.quantile * 100))
+
+
+class MetricsCollector:
+    """collects wait time, time in system and queue length statistics as the simulation runs
+
+    Person.update_state and Elevator.update_state report to the collector in their simulation's
+    metrics (if it has one). Per-trip values are folded into running statistics and fixed-size
+    time of day buckets as soon as each trip finishes.
+    """
+
+    QUANTILES = [.5, .9, .99]
+
+    def __init__(self, building, bucket_size=settings.METRICS_BUCKET_SIZE):
+        """MetricsCollector Constructor
+
+        Args:
+            building: building being simulated (used for floor names)
+            bucket_size: width (in seconds) of the time of day buckets
+        """
+        self.floor_names = list(building.floor_order)
+        self.bucket_size = bucket_size
+        num_buckets = int(math.ceil(24 * 3600 / bucket_size))
+        num_floors = len(self.floor_names)
+
+        self.wait_time = RunningStats()
+        self.tis = RunningStats()
+        self.wait_quantiles = [P2Quantile(i) for i in self.QUANTILES]
+        self.tis_quantiles = [P2Quantile(i) for i in self.QUANTILES]
+
+        # time in system by origin floor and by number of floors traveled
+        self.tis_by_origin = [RunningStats() for _ in range(num_floors)]
+        self.tis_by_distance = [RunningStats() for _ in range(num_floors)]
+
+        # sums of wait time and time in system by arrival time (time of day bucket)
+        self.bucket_trips = np.zeros(num_buckets)
+        self.bucket_wait = np.zeros(num_buckets)
+        self.bucket_tis = np.zeros(num_buckets)
+
+        # integral of the number of people queued over each bucket (person-seconds)
+        self.bucket_queue_area = np.zeros(num_buckets)
+        self._queue_len = 0
+        self._queue_len_time = None
+        self._max_day = 0
+
+        # elevator usage, by elevator id
+        self.elevator_stops = {}
+        self.elevator_floors = {}
+
+    def person_updated(self, person, day, time):
+        """record a person's state change (called from Person.update_state)"""
+        if person.state == person.States.QUEUED:
+            self._queue_len_changed(time, 1)
+            self._max_day = max(self._max_day, day)
+        elif person.state == person.States.SERVICE:
+            self._queue_len_changed(time, -1)
+        elif person.state == person.States.IDLE:
+            self.trip_finished(
+                person.origin.index,
+                person.destination.index,
+                person.queued_time,
+                person.boarded_time,
+                time)
+
+    def elevator_updated(self, elevator):
+        """record an elevator's state change (called from Elevator.update_state)"""
+        if elevator.state == elevator.States.STOPPED:
+            self.elevator_stops[elevator.id] = self.elevator_stops.get(elevator.id, 0) + 1
+        elif elevator.state == elevator.States.MOVING:
+            self.elevator_floors[elevator.id] = (
+                self.elevator_floors.get(elevator.id, 0)
+                + elevator.next_dest.distance_to(elevator.curr_floor))
+
+    def trip_finished(self, origin, dest, queued, boarded, alighted):
+        """record a completed trip
+
+        Args:
+            origin: index of the origin floor
+            dest: index of the destination floor
+            queued: time the person queued at the origin floor
+            boarded: time the person boarded an elevator
+            alighted: time the person got off at their destination
+        """
+        wait_time = boarded - queued
+        tis = alighted - queued
+
+        self.wait_time.add(wait_time)
+        self.tis.add(tis)
+        for i in self.wait_quantiles:
+            i.add(wait_time)
+        for i in self.tis_quantiles:
+            i.add(tis)
+
+        self.tis_by_origin[origin].add(tis)
+        self.tis_by_distance[abs(dest - origin)].add(tis)
+
+        bucket = self._bucket(queued)
+        self.bucket_trips[bucket] += 1
+        self.bucket_wait[bucket] += wait_time
+        self.bucket_tis[bucket] += tis
+
+    def _bucket(self, time):
+        """index of the time of day bucket <time> falls in"""
+        return min(max(int(time // self.bucket_size), 0), len(self.bucket_trips) - 1)
+
+    def _queue_len_changed(self, time, change):
+        """integrate the number of people queued up to <time>, then apply the change"""
+        last = self._queue_len_time
+        if last is None or time < last:
+            # first event, or a new day started (the clock is seconds since midnight)
+            last = time
+        while last < time and self._queue_len > 0:
+            bucket = self._bucket(last)
+            end = min(time, (bucket + 1) * self.bucket_size)
+            if bucket == len(self.bucket_trips) - 1:
+                end = time
+            self.bucket_queue_area[bucket] += self._queue_len * (end - last)
+            last = end
+        self._queue_len += change
+        self._queue_len_time = time
+
+    def write(self, stats_dir):
+        """write stats.txt and the plots to stats_dir"""
+        if not os.path.exists(stats_dir):
+            os.makedirs(stats_dir)
+
+        with open(os.path.join(stats_dir, sim_stats.STATS_FILE_NAME), 'w') as stats_file:
+            print("average wait time (seconds):", self.wait_time.mean, file=stats_file)
+            print("wait time standard deviation (seconds):", self.wait_time.std(), file=stats_file)
+            print("average time in system (seconds):", self.tis.mean, file=stats_file)
+            print("time in system standard deviation (seconds):", self.tis.std(), file=stats_file)
+            for quantile, wait_est, tis_est in zip(
+                    self.QUANTILES, self.wait_quantiles, self.tis_quantiles):
+                print("p{} wait time (seconds):".format(int(quantile * 100)), wait_est.value(),
+                      "time in system (seconds):", tis_est.value(), file=stats_file)
+            print("trips:", self.tis.count, file=stats_file)
+            print("elevator stops:", sum(self.elevator_stops.values()), file=stats_file)
+            print("floors traveled by elevators:", sum(self.elevator_floors.values()),
+                  file=stats_file)
+
+        ## time in system vs floors traveled
+        distances = [i for i, agg in enumerate(self.tis_by_distance) if agg.count > 0]
+        sim_stats.bar_plot(
+            distances, [self.tis_by_distance[i].mean for i in distances],
+            "Floors Traveled", "Time in System (seconds)",
+            os.path.join(stats_dir, "tis_vs_travel_distance.png"))
+
+        ## time in system vs origin floor
+        origins = [i for i, agg in enumerate(self.tis_by_origin) if agg.count > 0]
+        sim_stats.bar_plot(
+            [self.floor_names[i] for i in origins], [self.tis_by_origin[i].mean for i in origins],
+            "Origin Floor", "Time in System (seconds)",
+            os.path.join(stats_dir, "tis_vs_origin_floor.png"))
+
+        ## avg wait time and time in system vs. arrival time (bucketed)
+        times = np.arange(len(self.bucket_trips)) * self.bucket_size
+        has_trips = self.bucket_trips > 0
+        sim_stats.line_plot(
+            times[has_trips], self.bucket_wait[has_trips] / self.bucket_trips[has_trips],
+            "Arrival Time (seconds since 12AM)", "Wait Time (seconds)",
+            os.path.join(stats_dir, "wait_time_vs_tod.png"))
+        sim_stats.line_plot(
+            times[has_trips], self.bucket_tis[has_trips] / self.bucket_trips[has_trips],
+            "Arrival Time (seconds since 12AM)", "Time in System (seconds)",
+            os.path.join(stats_dir, "tis_vs_tod.png"))
+
+        ## average queue length throughout the day
+        sim_stats.line_plot(
+            times, self.bucket_queue_area / self.bucket_size / (self._max_day + 1),
+            "Arrival Time (seconds since 12AM)", "Queue Length (all floors)",
+            os.path.join(stats_dir, "avg_queue_len.png"))
@@ -0,0 +1,280 @@
+"""searches sector layouts for the fixed sector algorithms
+
+The objective is the average wait time (or time in system) of an experiment, measured by
+simulating it, so every candidate layout costs a simulation of every day of the experiment. To
+make exploring many layouts practical:
+
+    - candidates are evaluated in parallel on a process pool, from arrivals cached (and memory
+      mapped) up front
+    - evaluations are memoized, layouts that only differ in which car has which sectors are the
+      same layout (the cars are identical)
+    - a candidate is aborted as soon as its partial results prove it can't be accepted: the wait
+      times of the trips finished so far only add up, so divided by the number of trips in the
+      experiment they are a lower bound of the final average
+
+The search is simulated annealing with batches of proposals. Each proposal draws its acceptance
+threshold (current value + temperature * an exponential random variable) before it is evaluated,
+which is the bound it is aborted at.
+
+Usage:
+    python -m optimizer experiments.json FS0 [--iterations N] [--output optimized.json]
+"""
+
+# standard imports
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import dataclasses
+import json
+import os
+
+# third party imports
+import numpy as np
+
+# local imports
+import settings
+from building import Building
+from metrics import MetricsCollector
+import experiment
+import runner
+
+
+def evaluate_sectors(spec, metric, total_trips, bound=None):
+    """simulates an experiment with a sector layout (runs in a worker process)
+
+    Args:
+        spec: experiment.ExperimentSpec with the sectors to evaluate
+        metric: statistic to average, "wait_time" or "tis" (time in system)
+        total_trips: number of trips simulated over every day of the experiment
+        bound: (optional) abort once the average is known to be at least this
+
+    Returns:
+        (average, complete), if the evaluation was aborted the average is a lower bound
+    """
+    building = Building(spec.floors)
+    metrics = MetricsCollector(building)
+    stats = getattr(metrics, metric)
+    for replication in range(len(spec.seeds)):
+        for day_idx in range(len(spec.days)):
+            sim = experiment.setup_day(spec, building, day_idx, replication, metrics=metrics)
+            checkpoint = 0
+            while not sim.feq.empty():
+                checkpoint += settings.OPTIMIZER_CHECKPOINT
+                sim.run(until=checkpoint)
+                lower_bound = stats.mean * stats.count / total_trips
+                if bound is not None and lower_bound >= bound:
+                    return lower_bound, False
+    return stats.mean, True
+
+def layout_key(sectors):
+    """memoization key of a sector layout (the order of the cars doesn't matter)"""
+    return tuple(sorted((tuple(up), tuple(down)) for up, down in sectors))
+
+
+class SectorOptimizer:
+    """simulated annealing over the sector layouts of a fixed sector experiment"""
+
+    def __init__(self, spec, metric="wait_time", workers=settings.WORKERS, batch_size=None,
+                 temperature=None, cooling=.9, seed=None):
+        """SectorOptimizer Constructor
+
+        Args:
+            spec: experiment.ExperimentSpec of a fixed sector algorithm, its sectors are the
+                  starting layout
+            metric: statistic to minimize, "wait_time" or "tis" (time in system)
+            workers: number of worker processes (None: one per CPU)
+            batch_size: number of layouts proposed (and evaluated in parallel) per iteration,
+                        defaults to the number of workers
+            temperature: starting temperature (seconds), defaults to 5% of the starting value
+            cooling: factor the temperature is multiplied by after each iteration
+            seed: (optional) seed for the random number generator
+        """
+        if not hasattr(experiment.ALGORITHMS[spec.algorithm], "set_sector"):
+            raise ValueError("algorithm {!r} doesn't use sectors".format(spec.algorithm))
+        if metric not in ("wait_time", "tis"):
+            raise ValueError("unknown metric {!r}".format(metric))
+
+        self.spec = spec
+        self.metric = metric
+        self.workers = workers
+        self.batch_size = batch_size
+        self.temperature = temperature
+        self.cooling = cooling
+        self._rng = np.random.default_rng(seed)
+        self._memo = {} # layout key -> (average, complete)
+        self._total_trips = None
+        self.evaluated = 0 # simulated layouts
+        self.aborted = 0 # simulated layouts aborted early
+        self.cached = 0 # layouts answered from the memo
+
+    def run(self, iterations):
+        """runs the search
+
+        Args:
+            iterations: number of batches of layouts to propose
+
+        Returns:
+            (best layout found, its average)
+        """
+        runner.prepare_arrivals([self.spec])
+        self._total_trips = self._count_trips()
+
+        current = self.spec.sectors
+
+        batch_size = self.batch_size or self.workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            current_value = self._evaluate(pool, [current], [None])[0]
+            best, best_value = current, current_value
+            temperature = self.temperature
+            if temperature is None:
+                temperature = .05 * current_value
+
+            for iteration in range(iterations):
+                proposals = [self._neighbor(current) for _ in range(batch_size)]
+                thresholds = [
+                    current_value + temperature * self._rng.exponential()
+                    for _ in range(batch_size)]
+                values = self._evaluate(pool, proposals, thresholds)
+
+                # move to the best accepted proposal
+                accepted = [
+                    (value, idx) for idx, value in enumerate(values)
+                    if value is not None and value < thresholds[idx]]
+                if accepted:
+                    current_value, idx = min(accepted)
+                    current = proposals[idx]
+                    if current_value < best_value:
+                        best, best_value = current, current_value
+
+                temperature *= self.cooling
+                print("iteration {}: current {:.3f}, best {:.3f} "
+                      "({} simulated, {} aborted, {} cached)".format(
+                          iteration, current_value, best_value,
+                          self.evaluated, self.aborted, self.cached))
+
+        return best, best_value
+
+    def _evaluate(self, pool, layouts, bounds):
+        """evaluates layouts in parallel
+
+        Args:
+            pool: executor to evaluate layouts on
+            layouts: sector layouts
+            bounds: bound each layout is aborted at (None to evaluate it fully)
+
+        Returns:
+            list of the layouts' averages, None for layouts that were aborted
+        """
+        # group the layouts by key, each distinct layout is evaluated (at most) once
+        pending = {}
+        for layout, bound in zip(layouts, bounds):
+            key = layout_key(layout)
+            if key in pending:
+                other_layout, other_bound = pending[key]
+                if bound is None or (other_bound is not None and bound > other_bound):
+                    pending[key] = (other_layout, bound)
+            else:
+                pending[key] = (layout, bound)
+
+        futures = {}
+        for key, (layout, bound) in pending.items():
+            if key in self._memo:
+                value, complete = self._memo[key]
+                if complete or (bound is not None and value >= bound):
+                    self.cached += 1
+                    continue
+            futures[key] = pool.submit(
+                evaluate_sectors, dataclasses.replace(self.spec, sectors=layout), self.metric,
+                self._total_trips, bound)
+
+        for key, future in futures.items():
+            value, complete = future.result()
+            self.evaluated += 1
+            if not complete:
+                self.aborted += 1
+            self._memo[key] = (value, complete)
+
+        results = []
+        for layout in layouts:
+            value, complete = self._memo[layout_key(layout)]
+            results.append(value if complete else None)
+        return results
+
+    def _count_trips(self):
+        """number of trips simulated over every day of the experiment"""
+        building = Building(self.spec.floors)
+        return sum(
+            len(experiment.load_arrivals(building, day, seed).times[:self.spec.limit])
+            for seed in self.spec.seeds for day in self.spec.days)
+
+    def _random_sector(self):
+        """random sector [lower floor, upper floor] (the upper floor is excluded, see set_sector)"""
+        floors = self.spec.floors
+        low = int(self._rng.integers(len(floors) - 1))
+        high = int(self._rng.integers(low + 1, len(floors)))
+        return [floors[low], floors[high]]
+
+    def _neighbor(self, layout):
+        """random layout that differs from <layout> by one sector"""
+        floors = self.spec.floors
+        layout = [[list(up), list(down)] for up, down in layout]
+        key = layout_key(layout)
+        neighbor = layout
+        while layout_key(neighbor) == key:
+            neighbor = [[list(up), list(down)] for up, down in layout]
+            car = int(self._rng.integers(len(neighbor)))
+            direction = int(self._rng.integers(2))
+            if self._rng.random() < .2:
+                # jump to a random sector
+                neighbor[car][direction] = self._random_sector()
+                continue
+
+            # move one end of the sector by a floor (keeping at least one floor in it)
+            low, high = [floors.index(i) for i in neighbor[car][direction]]
+            if self._rng.random() < .5:
+                low = min(max(low + int(self._rng.choice([-1, 1])), 0), high - 1)
+            else:
+                high = min(max(high + int(self._rng.choice([-1, 1])), low + 1), len(floors) - 1)
+            neighbor[car][direction] = [floors[low], floors[high]]
+        return neighbor
+
+
+def main(args=None):
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description="searches sector layouts for an experiment")
+    parser.add_argument("spec_file", help="experiment spec file (json/toml/yaml)")
+    parser.add_argument("name", help="name of the (fixed sector) experiment to optimize")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--metric", choices=["wait_time", "tis"], default="wait_time")
+    parser.add_argument("--workers", type=int, default=settings.WORKERS,
+                        help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="layouts evaluated per iteration (default: number of workers)")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="only simulate the first LIMIT arrivals of each day")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=None,
+                        help="write the experiment with the best layout to this json file")
+    args = parser.parse_args(args)
+
+    specs = [i for i in experiment.load_specs(args.spec_file) if i.name == args.name]
+    if not specs:
+        parser.error("no experiment named {!r} in {}".format(args.name, args.spec_file))
+    spec = specs[0]
+    if args.limit is not None:
+        spec = dataclasses.replace(spec, limit=args.limit)
+
+    optimizer = SectorOptimizer(
+        spec, metric=args.metric, workers=args.workers, batch_size=args.batch_size,
+        seed=args.seed)
+    best, best_value = optimizer.run(args.iterations)
+
+    print("best average {} (seconds): {}".format(args.metric, best_value))
+    print(json.dumps(best))
+    if args.output is not None:
+        with open(args.output, 'w') as out_file:
+            json.dump([dataclasses.asdict(dataclasses.replace(spec, sectors=best))], out_file,
+                      indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,8 @@
 from enum import Enum, auto
 import csv
 import datetime
+import hashlib
+import math
 import os
 
 import numpy as np
@@ -13,9 +15,14 @@ import settings
 
 
 class Person:
-    """models a person"""
+    """models a person
 
-    person_ctr = 0
+    A person is a lightweight handle (see __slots__) onto their row of their simulation's
+    PersonTable, which holds everything about them. Handles are created when people arrive, and
+    are what floor queues and elevators hold.
+    """
+
+    __slots__ = ("id", "_sim")
 
     class States(Enum):
         """states implemented for stations"""
@@ -23,25 +30,56 @@ class Person:
         QUEUED = auto()
         SERVICE = auto() # elevator moving between floors
 
-    def __init__(self, logger, origin, destination):
+    def __init__(self, sim, origin, destination):
         """ Person Constructor
 
-        Each person has a unique id (_id), and keeps track of their own state changes. All
-        state changes are logged in the person logger.
+        Each person has a unique id (their row in sim.people), and keeps track of their own state
+        changes. All state changes are logged in the simulation's person logger (if it has one).
 
         Args:
-            logger: instance of a logger
+            sim: simulation (engine.Simulation) the person belongs to
             origin: origin floor (instance of Floor object)
             destination: destination floor (instance of Floor object)
         """
-        self.state = self.States.IDLE
-        self.id = self.__class__.person_ctr
-        self.logger = logger
-        self.curr_elevator = None
-        self.origin = origin
-        self.destination = destination
-
-        self.__class__.person_ctr += 1
+        self._sim = sim
+        self.id = sim.people.add(origin.index, destination.index)
+
+    @property
+    def state(self):
+        """current state (instance of self.States class)"""
+        return STATES[self._sim.people.state[self.id]]
+
+    @property
+    def origin(self):
+        """origin floor"""
+        people = self._sim.people
+        return people.floors[people.origin[self.id]]
+
+    @property
+    def destination(self):
+        """destination floor"""
+        people = self._sim.people
+        return people.floors[people.destination[self.id]]
+
+    @property
+    def curr_elevator(self):
+        """elevator the person boarded (None until they board)"""
+        elevator_id = self._sim.people.elevator[self.id]
+        return self._sim.elevators[elevator_id] if elevator_id >= 0 else None
+
+    @curr_elevator.setter
+    def curr_elevator(self, elevator):
+        self._sim.people.elevator[self.id] = elevator.id if elevator is not None else -1
+
+    @property
+    def queued_time(self):
+        """time the person queued at their origin floor (None until they queue)"""
+        return self._sim.people.time_or_none(self._sim.people.queued_time, self.id)
+
+    @property
+    def boarded_time(self):
+        """time the person boarded an elevator (None until they board)"""
+        return self._sim.people.time_or_none(self._sim.people.boarded_time, self.id)
 
     def update_state(self, state):
         """updates current state. if none specified, updates based on current state variables.
@@ -49,18 +87,26 @@ class Person:
         Args:
             state: instance of self.States class
         """
-        self.state = state
-        self.logger.write_log(self, settings.CURR_DAY, settings.CURR_TIME)
+        sim = self._sim
+        curr_time = sim.curr_time
+        sim.people.state[self.id] = state.value
+        if state == self.States.QUEUED:
+            sim.people.queued_time[self.id] = curr_time
+        elif state == self.States.SERVICE:
+            sim.people.boarded_time[self.id] = curr_time
+        if sim.person_logger is not None:
+            sim.person_logger.write_log(self, sim.curr_day, curr_time)
+        if sim.metrics is not None:
+            sim.metrics.person_updated(self, sim.curr_day, curr_time)
         if settings.VERBOSE:
-            print("{0:.2f}".format(settings.CURR_TIME), "Person:", self, self.state)
+            print("{0:.2f}".format(curr_time), "Person:", self, state)
 
-        if self.state == self.States.QUEUED:
+        if state == self.States.QUEUED:
             # add self to queue at origin floor
-            self.origin.push(self, settings.CURR_TIME)
+            self.origin.push(self, curr_time)
 
-            # update state of the elevators to make sure they're aware of people waiting
-            for i in settings.ELEVATORS:
-                i.update_state()
+            # wake up the idle elevators (busy ones pick up the call when they stop)
+            sim.person_queued(self)
 
     def __str__(self):
         return "{} -> {}".format(self.origin.name, self.destination.name)
@@ -68,32 +114,189 @@ class Person:
     __repr__ = __str__
 
     def __eq__(self, cmp):
-        return self.id == cmp.id  # pylint: disable=W0212
+        return self.id == cmp.id
+
+# Person.States member of each state value
+STATES = {i.value: i for i in Person.States}
+
+class PersonTable:
+    """everyone in a simulation, one row per person (indexed by Person.id)
+
+    Columns are preallocated numpy arrays, grown (doubled) when they fill up:
+        origin, destination: floor indices (position in building.floor_order)
+        state: value of the person's Person.States member
+        elevator: id of the elevator the person boarded (-1 until they board)
+        queued_time, boarded_time: (NaN until set)
+
+    That's 23 bytes per person, plus a 48 byte Person handle for the people currently in the
+    building.
+    """
+
+    def __init__(self, building, size=0):
+        """PersonTable Constructor
+
+        Args:
+            building: building being simulated
+            size: (optional) number of rows to preallocate
+        """
+        self.floors = [building.floor[i] for i in building.floor_order]
+        self._len = 0
+        self.origin = np.empty(0, dtype=np.int16)
+        self.destination = np.empty(0, dtype=np.int16)
+        self.state = np.empty(0, dtype=np.int8)
+        self.elevator = np.empty(0, dtype=np.int16)
+        self.queued_time = np.empty(0, dtype=np.float64)
+        self.boarded_time = np.empty(0, dtype=np.float64)
+        self.reserve(size)
+
+    def reserve(self, size):
+        """preallocates rows so the table holds at least <size> people without growing"""
+        if size <= len(self.origin):
+            return
+        self.origin = self._grow(self.origin, size)
+        self.destination = self._grow(self.destination, size)
+        self.state = self._grow(self.state, size)
+        self.elevator = self._grow(self.elevator, size)
+        self.queued_time = self._grow(self.queued_time, size)
+        self.boarded_time = self._grow(self.boarded_time, size)
+
+    def _grow(self, column, size):
+        """returns a copy of a column with <size> rows, the table's rows copied over"""
+        grown = np.empty(size, dtype=column.dtype)
+        grown[:self._len] = column[:self._len]
+        return grown
+
+    def add(self, origin, destination):
+        """adds an idle person, returns their id
+
+        Args:
+            origin: origin floor index
+            destination: destination floor index
+        """
+        row = self._len
+        if row == len(self.origin):
+            self.reserve(max(2 * row, 1024))
+        self._len += 1
+        self.origin[row] = origin
+        self.destination[row] = destination
+        self.state[row] = Person.States.IDLE.value
+        self.elevator[row] = -1
+        self.queued_time[row] = np.nan
+        self.boarded_time[row] = np.nan
+        return row
+
+    @staticmethod
+    def time_or_none(column, row):
+        """returns a time column's value for a row as a float (None if it isn't set)"""
+        value = float(column[row])
+        return None if math.isnan(value) else value
+
+    def __len__(self):
+        return self._len
 
 class ArrivalGenerator:
     """models floor arrivals based on source data (can save/load data)
 
+    Arrivals are kept as three parallel numpy arrays: elevator arrival time (seconds since
+    midnight), origin floor index and destination floor index (indices into
+    building.floor_order). Person instances are only created when an arrival is dispatched from the
+    future event queue: the generator itself is the scheduled object, and the event's "state" is
+    the index of the arrival.
+
     Usage:
-        arr_gen = ArrivalGenerator(building, person_logger)
+        arr_gen = ArrivalGenerator(building)
         arr_gen.gen_from_classes('class_list.csv')
         arr_gen.save('saved_arrvals.csv')
         arr_gen.load('saved_arrvals.csv')
 
-        for i in arr_gen.arrival_times:
-            # add i to queue
+        arr_gen.schedule(sim)
+
+    Loaded and generated arrivals are cached as .npy files in settings.ARRIVALS_CACHE_DIR. The
+    cache is keyed on a hash of the source file (and, for generated arrivals, the days, seed and
+    distribution parameters), so a stale cache is never used: it is regenerated under a new key.
+    Cache files are memory-mapped when loaded, so processes simulating the same arrivals share one
+    copy of them.
     """
 
-    def __init__(self, building, person_logger):
+    # chi-square degrees of freedom for arrivals (before class) and departures (after class)
+    ARRIVAL_DF = 4
+    DEPARTURE_DF = 1
+
+    # record format of the arrival cache files
+    CACHE_DTYPE = np.dtype([('time', np.float64), ('origin', np.int16), ('dest', np.int16)])
+
+    def __init__(self, building, seed=None):
         """ArrivalGenerator Contstructor
 
         Args:
             building: reference to building object arrivals are generated for
-            person_logger: logger to use when creating "person" instances
+            seed: (optional) seed for the random number generator (see numpy.random.default_rng)
         """
         # init instance variables
-        self.arrival_times = []
-        self._person_logger = person_logger
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
+        self.times = np.empty(0, dtype=np.float64)
+        self.origins = np.empty(0, dtype=np.int16)
+        self.destinations = np.empty(0, dtype=np.int16)
+        self._sim = None
         self._building = building
+        self._floors = [building.floor[i] for i in building.floor_order]
+
+    def __len__(self):
+        return len(self.times)
+
+    def clear(self):
+        """remove all arrivals"""
+        self._set(
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.int16),
+            np.empty(0, dtype=np.int16))
+
+    def _set(self, times, origins, destinations):
+        """replace the arrival arrays"""
+        self.times = times
+        self.origins = origins.astype(np.int16, copy=False)
+        self.destinations = destinations.astype(np.int16, copy=False)
+
+    def _extend(self, times, origins, destinations):
+        """add arrivals to the end of the arrival arrays"""
+        self._set(
+            np.concatenate((self.times, times)),
+            np.concatenate((self.origins, origins)),
+            np.concatenate((self.destinations, destinations)))
+
+    def schedule(self, sim, limit=None):
+        """add arrivals to a simulation's future event queue (as a single stream of events)
+
+        Note: arrivals can only be scheduled in one simulation at a time, people are created in the
+              simulation arrivals were last scheduled in
+
+        Args:
+            sim: engine.Simulation to add arrivals to
+            limit: (optional) only schedule the first <limit> arrivals
+        """
+        self._sim = sim
+        times = self.times[:limit]
+        sim.people.reserve(len(sim.people) + len(times))
+        if np.all(times[1:] >= times[:-1]):
+            sim.feq.add_stream(times.tolist(), self)
+        else:
+            order = np.argsort(times, kind='stable')
+            sim.feq.add_stream(times[order].tolist(), self, order.tolist())
+
+    def update_state(self, idx):
+        """dispatch an arrival (called when its event comes off of the future event queue)
+
+        Creates the arriving person and queues them at their origin floor.
+
+        Args:
+            idx: index of the arrival
+        """
+        person = Person(
+            self._sim,
+            self._floors[self.origins[idx]],
+            self._floors[self.destinations[idx]])
+        person.update_state(person.States.QUEUED)
 
     def save(self, path):
         """saves current arrivals to a file
@@ -107,40 +310,116 @@ class ArrivalGenerator:
         if not os.path.exists(dirs):
             os.makedirs(dirs)
 
+        floor_order = self._building.floor_order
         with open(path, 'w') as arr_csv:
-            fields = ['arrival_time', 'origin', 'destination']
-            writer = csv.DictWriter(arr_csv, fieldnames=fields)
-            writer.writeheader()
-            for i in self.arrival_times:
-                writer.writerow({
-                    'arrival_time': i[0],
-                    'origin': i[1].origin.name,
-                    'destination': i[1].destination.name,
-                })
-
-    def load(self, path, replace=True):
+            writer = csv.writer(arr_csv)
+            writer.writerow(['arrival_time', 'origin', 'destination'])
+            writer.writerows(
+                (time, floor_order[origin], floor_order[dest])
+                for time, origin, dest in zip(
+                    self.times.tolist(), self.origins.tolist(), self.destinations.tolist()))
+
+    def load(self, path, replace=True, cache_dir=settings.ARRIVALS_CACHE_DIR):
         """loads arrival times from a file
 
         Args:
             path: file to load from
-            replace: whether or not to delete anything currently in the self.arrival_times list
+            replace: whether or not to delete any arrivals that are currently loaded
+            cache_dir: directory of the arrival cache (None to always parse the file)
         """
+        if cache_dir is None:
+            self._add(self._read_csv(path), replace)
+            return
+
+        name = os.path.splitext(os.path.basename(path))[0]
+        cache_path = self._cache_path(cache_dir, name, self._cache_key(file_digest(path)))
+        if not os.path.exists(cache_path):
+            self._write_cache(cache_path, self._read_csv(path))
+        self._add(self._read_cache(cache_path), replace)
+
+    def gen_cached(self, file_path, days, replace=True, cache_dir=settings.ARRIVALS_CACHE_DIR):
+        """generates arrivals from a class enrollment list, or loads them if already cached
+
+        When the generator has a seed, the random numbers used are seeded from the cache key, so
+        the arrivals for a key are always the same whether they are generated or loaded.
+
+        Args:
+            file_path: path to class schedule file
+            days: list of days being simulated (see gen_from_classes)
+            replace: whether or not to delete any arrivals that are currently loaded
+            cache_dir: directory of the arrival cache
+        """
+        key = self._cache_key(
+            file_digest(file_path), sorted(days), self.seed,
+            self.ARRIVAL_DF, self.DEPARTURE_DF, settings.G_ENTRY_PCT)
+        cache_path = self._cache_path(cache_dir, "-".join(days), key)
+        if not os.path.exists(cache_path):
+            gen = ArrivalGenerator(
+                self._building, seed=None if self.seed is None else int(key, 16))
+            gen.gen_from_classes(file_path, days)
+            self._write_cache(cache_path, (gen.times, gen.origins, gen.destinations))
+        self._add(self._read_cache(cache_path), replace)
+
+    def _add(self, arrivals, replace):
+        """replace or extend the current arrivals with (times, origins, destinations)"""
+        if replace:
+            self._set(*arrivals)
+        else:
+            self._extend(*arrivals)
+
+    def _read_csv(self, path):
+        """parses a saved arrivals csv into (times, origins, destinations) arrays"""
         with open(path, 'r') as arr_csv:
             reader = csv.DictReader(arr_csv)
+            rows = [(row['arrival_time'], row['origin'], row['destination']) for row in reader]
 
-            if replace:
-                self.arrival_times = []
+        floor_idx = {name: floor.index for name, floor in self._building.floor.items()}
+        return (
+            np.array([i[0] for i in rows], dtype=np.float64),
+            np.array([floor_idx[i[1]] for i in rows], dtype=np.int16),
+            np.array([floor_idx[i[2]] for i in rows], dtype=np.int16))
 
-            for row in reader:
-                self.arrival_times.append((float(row['arrival_time']), Person(
-                    self._person_logger,
-                    self._building.floor[row['origin']],
-                    self._building.floor[row['destination']])))
+    def _cache_key(self, *key_parts):
+        """hashes the parts of a cache key into a key string
+
+        The building's floor order is part of every key since arrivals are stored as floor indices.
+        """
+        key_parts = (list(self._building.floor_order),) + key_parts
+        return hashlib.sha1(repr(key_parts).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _cache_path(cache_dir, name, key):
+        """path of the cache file for the arrivals identified by <key>"""
+        return os.path.join(cache_dir, "{}_{}.npy".format(name, key))
+
+    @staticmethod
+    def _read_cache(cache_path):
+        """memory-maps a cache file, returns (times, origins, destinations) views of it"""
+        arrivals = np.load(cache_path, mmap_mode='r')
+        return arrivals['time'], arrivals['origin'], arrivals['dest']
+
+    def _write_cache(self, cache_path, arrivals):
+        """writes (times, origins, destinations) to a cache file
+
+        The file is written under a temporary name and then renamed, so other processes never see
+        a partially written cache.
+        """
+        records = np.empty(len(arrivals[0]), dtype=self.CACHE_DTYPE)
+        records['time'], records['origin'], records['dest'] = arrivals
+
+        dirs = os.path.dirname(cache_path)
+        if not os.path.exists(dirs):
+            os.makedirs(dirs, exist_ok=True)
+        tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+        with open(tmp_path, 'wb') as cache_file:
+            np.save(cache_file, records)
+        os.replace(tmp_path, cache_path)
 
     def gen_from_classes(self, file_path, days=None):
         """generates arrivals from class enrollment list
 
-        Note: each person only makes one journey
+        Note: each person only makes one journey. All of the classes are sampled together, the new
+              arrivals are added in order of elevator arrival time.
 
         Args:
             file_path: path to class schedule file
@@ -152,7 +431,8 @@ class ArrivalGenerator:
         else:
             days = set(days)
 
-        # read csv, for each class, generate arrivals and departures
+        # read csv, collect the classes that need elevator trips
+        floors, starts, ends, nums = [], [], [], []
         for i in ArrivalGenerator.parse_csv(file_path):
             # if class isn't scheduled for a day we care about, skip
             if len(days & set(i['days'])) == 0:
@@ -162,18 +442,31 @@ class ArrivalGenerator:
             if i['floor'] == 'G' or i['floor'] == '1':
                 continue
 
-            # generate elevator arrivals from class
-            self.arrival_times.extend(self.gen_arrival_times(
-                i['floor'],
-                i['start'],
-                i['num_enrolled']))
-            self.arrival_times.extend(self.gen_departure_times(
-                i['floor'],
-                i['end'],
-                i['num_enrolled']))
+            floors.append(self._building.floor[i['floor']].index)
+            starts.append(i['start'])
+            ends.append(i['end'])
+            nums.append(i['num_enrolled'])
 
-    def gen_arrival_times(self, floor, time, num):
-        """Generates <num> arrivals at a floor for a particular time.
+        # generate elevator arrivals and departures for all classes at once
+        arr_times, arr_origins, arr_dests = self.gen_arrival_times(floors, starts, nums)
+        dep_times, dep_origins, dep_dests = self.gen_departure_times(floors, ends, nums)
+
+        times = np.concatenate((arr_times, dep_times))
+        order = np.argsort(times, kind='stable')
+        self._extend(
+            times[order],
+            np.concatenate((arr_origins, dep_origins))[order],
+            np.concatenate((arr_dests, dep_dests))[order])
+
+    def _entry_floors(self, num):
+        """randomly picks G or 1 as the floor each of <num> people enter/exit the building on"""
+        return np.where(
+            self._rng.random(num) < settings.G_ENTRY_PCT,
+            self._building.floor['G'].index,
+            self._building.floor['1'].index)
+
+    def gen_arrival_times(self, floors, times, nums):
+        """Generates arrivals for classes, <nums[i]> arrivals at floors[i] for time[i].
 
         Note: arrivals are generated according to a different distribution from departures.
 
@@ -181,29 +474,23 @@ class ArrivalGenerator:
         arrived by 3.35 min before class starts. (Chi-Square, df=4)
 
         Args:
-            floor: class's floor
-            time: time class starts
-            num: number of enrolled students
+            floors: each class's floor index
+            times: time each class starts
+            nums: number of enrolled students in each class
 
         Returns:
-            list of people w/ their elevator arrival time (in seconds since midnight).
-            ex:
-                [ (<elevator arrival time>, Person), ... ]
+            (elevator arrival times (in seconds since midnight), origin floor indices,
+             destination floor indices), as numpy arrays with one entry per person
         """
-        ret = []
-        for rand_time in np.random.chisquare(df=4, size=num):
-            if np.random.random_sample() < settings.G_ENTRY_PCT:
-                origin = self._building.floor['G']
-            else:
-                origin = self._building.floor['1']
-            dest = self._building.floor[floor]
-            elevator_arrival_time = time - rand_time*60 # sec to min
-            ret.append((elevator_arrival_time, Person(self._person_logger, origin, dest)))
-
-        return ret
+        class_idx = np.repeat(np.arange(len(nums)), nums)
+        rand_time = self._rng.chisquare(df=self.ARRIVAL_DF, size=len(class_idx))
+        elevator_arrival_times = np.asarray(times, dtype=np.float64)[class_idx] - rand_time*60
+        origins = self._entry_floors(len(class_idx))
+        dests = np.asarray(floors, dtype=np.int16)[class_idx]
+        return elevator_arrival_times, origins, dests
 
-    def gen_departure_times(self, floor, time, num):
-        """Generates <num> departures at a floor for a particular time
+    def gen_departure_times(self, floors, times, nums):
+        """Generates departures for classes, <nums[i]> departures from floors[i] at time[i]
 
         Note: departures are generated according to a different distribution from arrivals.
 
@@ -211,21 +498,20 @@ class ArrivalGenerator:
         left by 27 seconds after class ends. (Chi-Square, df=1)
 
         Args:
-            floor: class's floor
-            time: time class ends
-            num: number of enrolled students
+            floors: each class's floor index
+            times: time each class ends
+            nums: number of enrolled students in each class
+
+        Returns:
+            (elevator arrival times (in seconds since midnight), origin floor indices,
+             destination floor indices), as numpy arrays with one entry per person
         """
-        ret = []
-        for rand_time in np.random.chisquare(df=1, size=num):
-            origin = self._building.floor[floor]
-            if np.random.random_sample() < settings.G_ENTRY_PCT:
-                dest = self._building.floor['G']
-            else:
-                dest = self._building.floor['1']
-            elevator_arrival_time = time + rand_time*60 # sec to min
-            ret.append((elevator_arrival_time, Person(self._person_logger, origin, dest)))
-
-        return ret
+        class_idx = np.repeat(np.arange(len(nums)), nums)
+        rand_time = self._rng.chisquare(df=self.DEPARTURE_DF, size=len(class_idx))
+        elevator_arrival_times = np.asarray(times, dtype=np.float64)[class_idx] + rand_time*60
+        origins = np.asarray(floors, dtype=np.int16)[class_idx]
+        dests = self._entry_floors(len(class_idx))
+        return elevator_arrival_times, origins, dests
 
     @staticmethod
     def parse_csv(filename):
@@ -272,3 +558,12 @@ class ArrivalGenerator:
         """
         time = datetime.datetime.strptime(time_str, "%I:%M %p").time()
         return 3600 * time.hour + 60 * time.minute
+
+
+def file_digest(path):
+    """returns the sha1 hex digest of a file's contents"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(1 << 16), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
@@ -0,0 +1,185 @@
+"""look-ahead dispatching: sends each new hall call to the elevator whose simulated future (a
+fork of the simulation, see engine.Simulation.snapshot) has the lowest projected wait"""
+
+# standard imports
+from concurrent.futures import ProcessPoolExecutor, wait
+from timeit import default_timer as timer
+
+# third party imports
+import numpy as np
+
+# local imports
+import settings
+from elevators import ElevatorController, best_elevators
+from engine import Simulation
+
+# number of workers -> process pool look-ahead branches run on (see rollout_pool)
+_ROLLOUT_POOLS = {}
+
+class RolloutElevatorController(ElevatorController):
+    """
+    This controller looks ahead to pick the elevator each new hall call is sent to
+
+    When a hall call is placed, the simulation is forked (see engine.Simulation.snapshot) once
+    per elevator. In each branch the call is sent to that elevator, every other call is sent by
+    nearest car (see elevators.NearestCarElevatorController), and the next <horizon> seconds are
+    simulated. The call goes to the elevator whose branch has the lowest projected wait (see
+    rollout).
+
+    Calls are always dispatched incrementally (see elevators.ElevatorController): a call is only
+    looked ahead when it's placed, and dispatched again by nearest car, which is what the
+    branches assume happens next.
+
+    Branches run on a pool of worker processes, or one after the other in this process. If they
+    don't all finish within the decision's time budget, the call is sent by nearest car.
+    """
+
+    def __init__(self, sim, incremental=True, horizon=settings.ROLLOUT_HORIZON,
+                 workers=settings.ROLLOUT_WORKERS, budget=settings.ROLLOUT_BUDGET):
+        """RolloutElevatorController Constructor
+
+        Args:
+            sim: simulation (engine.Simulation) the controlled elevators belong to
+            incremental: must be True, calls are always dispatched incrementally
+            horizon: seconds each branch is simulated for
+            workers: number of worker processes the branches run on (0: in this process, None:
+                     one per CPU)
+            budget: (optional) seconds a decision's branches have to finish in
+        """
+        if not incremental:
+            raise ValueError("the look-ahead controller only dispatches hall calls incrementally")
+        super().__init__(sim, incremental=True)
+        self.horizon = horizon
+        self.workers = workers
+        self.budget = budget
+        self._in_branch = False # branches send every call by nearest car (no nested look-ahead)
+        self.look_aheads = 0 # calls sent by looking ahead
+        self.fallbacks = 0 # calls sent by nearest car because the budget ran out
+
+    def dispatch(self, calls):
+        """Send each new call to the elevator with the lowest projected wait, and every other
+        call to the elevator with the greatest figure of suitability"""
+        if not calls:
+            return []
+
+        new = set() if self._in_branch else set(i for i in calls if i not in self._owners)
+        pairs = []
+        for call, max_idx in zip(
+                calls, best_elevators(self.elevators, calls, len(self._building.floor_order))):
+            if call in new:
+                best_idx = self._look_ahead(call, calls)
+                if best_idx is None:
+                    self.fallbacks += 1
+                else:
+                    self.look_aheads += 1
+                    max_idx = best_idx
+            pairs.append((call, self.elevators[max_idx]))
+        return pairs
+
+    def _look_ahead(self, call, calls):
+        """simulates a branch for each elevator a new hall call could be sent to
+
+        Args:
+            call: FloorQueue of the new hall call
+            calls: FloorQueue of every hall call being dispatched with it
+
+        Ret:
+            index of the elevator with the lowest projected wait, None if the budget ran out
+        """
+        start = timer()
+        snapshot = self._sim.snapshot(detached=True)
+        until = self._sim.curr_time + self.horizon
+        others = [(i.floor.index, i.direction) for i in calls if i is not call]
+        branches = [
+            (snapshot, (call.floor.index, call.direction), others, elevator.id, until)
+            for elevator in self.elevators]
+
+        if self.workers == 0:
+            waits = []
+            for branch in branches:
+                if self.budget is not None and timer() - start > self.budget:
+                    return None
+                waits.append(rollout(*branch))
+        else:
+            pool = rollout_pool(self.workers)
+            futures = [pool.submit(rollout, *branch) for branch in branches]
+            timeout = None if self.budget is None else max(self.budget - (timer() - start), 0)
+            _, not_done = wait(futures, timeout=timeout)
+            if not_done:
+                for future in not_done:
+                    future.cancel()
+                return None
+            waits = [future.result() for future in futures]
+        return int(np.argmin(waits))
+
+    def set_branch(self, call, elevator, others):
+        """turns a forked copy of this controller into a look-ahead branch (see rollout)
+
+        Args:
+            call: FloorQueue of the hall call being looked ahead, sent to <elevator>
+            elevator: elevator the call is sent to
+            others: FloorQueue of the other hall calls that were being dispatched with it, they
+                    are sent by nearest car
+        """
+        self._in_branch = True
+        for other in others:
+            self._owners.pop(other, None)
+        self._owners[call] = [elevator]
+        self._calls_seen = None
+        self._assignments = None
+
+        # the rest of the idle elevators would have been woken up by the call (see
+        # ElevatorController.call_placed)
+        self._poll_idle(self.elevators)
+
+def rollout_pool(workers):
+    """returns the process pool look-ahead branches run on, created on first use and shared by
+    every RolloutElevatorController of the process
+
+    Args:
+        workers: number of worker processes (None: one per CPU)
+    """
+    if workers not in _ROLLOUT_POOLS:
+        _ROLLOUT_POOLS[workers] = ProcessPoolExecutor(max_workers=workers)
+    return _ROLLOUT_POOLS[workers]
+
+def rollout(snapshot, call, others, elevator_id, until):
+    """simulates a look-ahead branch (may run in a worker process, see RolloutElevatorController)
+
+    The projected wait of the branch is the total time everyone who was waiting when the
+    snapshot was taken, or queued after it (by <until>), waited to board, or had waited by
+    <until> if they haven't boarded yet.
+
+    Args:
+        snapshot: detached snapshot (see engine.Simulation.snapshot) taken while the call was
+                  being dispatched
+        call: (floor index, direction) of the hall call looked ahead
+        others: (floor index, direction) of the other hall calls being dispatched with it
+        elevator_id: id of the elevator the call is sent to in this branch
+        until: time the branch is simulated until
+
+    Ret:
+        projected wait (seconds)
+    """
+    sim = Simulation.restore(snapshot)
+    building = sim.building
+    start = sim.curr_time
+
+    # ids are given out in order of arrival, and everyone who arrived before the oldest person
+    # still waiting has boarded (and waited the same in every branch), so they're left out
+    first = min(
+        (call.oldest()[2].id for call in building.hall_call_lanes()), default=len(sim.people))
+
+    def lane(floor_idx, direction):
+        floor = building.floor[building.floor_order[floor_idx]]
+        return floor.up_queue if direction == "up" else floor.down_queue
+
+    elevator = sim.elevators[elevator_id]
+    elevator.dispatcher.set_branch(lane(*call), elevator, [lane(*i) for i in others])
+    sim.run(until=until)
+
+    people = sim.people
+    queued = people.queued_time[first:len(people)]
+    boarded = people.boarded_time[first:len(people)]
+    waiting = ~np.isnan(queued) & (np.isnan(boarded) | (boarded >= start))
+    return float(np.sum(np.fmin(boarded[waiting], until) - queued[waiting]))
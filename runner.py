@@ -0,0 +1,257 @@
+"""runs experiments in parallel
+
+Every (experiment, day, replication) is an independent job: it builds its own building and
+simulation, and logs people to its own shard database. Jobs are fanned out over a process pool,
+and as soon as all of an experiment's jobs are done its shards are merged into the experiment's
+person log and its stats are computed (also in the pool).
+
+Experiments with a number of replications set run in Monte Carlo mode instead (see
+run_replications): no logs are written, each replication's averages are streamed from its
+simulations and the runner reports confidence intervals for them.
+
+Usage:
+    python -m runner experiments.json [more_experiments.toml ...] [--workers N] [--limit N]
+"""
+
+# standard imports
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import dataclasses
+import os
+from timeit import default_timer as timer
+
+# third party imports
+import numpy as np
+
+# local imports
+import settings
+from building import Building
+from metrics import MetricsCollector, confidence_interval
+import experiment
+import logger
+import stats as sim_stats
+
+REPLICATIONS_FILE_NAME = "replications.txt"
+
+# a single simulated day of an experiment (see experiment.simulate_day)
+Job = namedtuple("Job", ["spec", "day_idx", "replication", "shard_path"])
+
+
+def prepare_arrivals(specs):
+    """generates (and saves or caches) the arrivals for every day of every experiment
+
+    Done once up front, so that workers only ever read arrivals.
+
+    Args:
+        specs: list of experiment.ExperimentSpec
+    """
+    for spec in specs:
+        building = Building(spec.floors)
+        for day in spec.days:
+            for seed in spec.seeds:
+                experiment.load_arrivals(building, day, seed)
+
+def run_job(job):
+    """simulates a single day of an experiment (runs in a worker process)
+
+    Args:
+        job: Job to run
+
+    Returns:
+        the job
+    """
+    person_logger = logger.create_person_logger(job.shard_path, remove_old=True, fast=True)
+    experiment.simulate_day(
+        job.spec, Building(job.spec.floors), job.day_idx, job.replication, person_logger)
+    if person_logger is not None:
+        person_logger.close()
+    return job
+
+def finish_experiment(spec, shard_paths):
+    """merges an experiment's shard logs and runs stats on them (runs in a worker process)"""
+    logger.merge_logs(spec.person_log_path, shard_paths, remove_shards=True)
+    sim_stats.run_stats(
+        person_log_path=spec.person_log_path, stats_dir=spec.stats_dir, floor_names=spec.floors)
+    return spec
+
+def run_summary_job(spec, day_idx, replication):
+    """simulates a single day of a replication without logging (runs in a worker process)
+
+    Returns:
+        (replication, number of trips, total wait time, total time in system)
+    """
+    building = Building(spec.floors)
+    metrics = MetricsCollector(building)
+    experiment.simulate_day(spec, building, day_idx, replication, metrics=metrics)
+    trips = metrics.tis.count
+    return replication, trips, metrics.wait_time.mean * trips, metrics.tis.mean * trips
+
+def run_replications(spec, workers=settings.WORKERS, min_replications=settings.MIN_REPLICATIONS):
+    """runs Monte Carlo replications of an experiment until its averages are precise enough
+
+    Each replication simulates every day of the experiment with arrivals from its own random
+    stream (see ExperimentSpec.spawn_seeds), one job per day. Replications run in waves of at
+    least one per worker. After each wave replications are accepted in order, and the run stops
+    at the first one for which the 95% confidence intervals of the average wait time and time in
+    system are within +/- spec.ci_half_width (so where it stops doesn't depend on the number of
+    workers), or once spec.replications have run.
+
+    The replications' averages and the confidence intervals are written to
+    <spec.stats_dir>/replications.txt.
+
+    Args:
+        spec: experiment.ExperimentSpec with replications set
+        workers: number of worker processes (None: one per CPU)
+        min_replications: number of replications accepted before the confidence intervals can
+                          stop the run
+
+    Ret:
+        dict of statistic ("wait_time", "tis") -> (mean, std, 95% CI half-width), plus the number
+        of "replications" accepted
+    """
+    if spec.replications is None:
+        raise ValueError("experiment {!r} doesn't set a number of replications".format(spec.name))
+    spec = spec.spawn_seeds()
+    wave_size = max(workers or os.cpu_count() or 1, min_replications)
+
+    # trips, total wait time and total time in system of each replication
+    totals = np.zeros((spec.replications, 3))
+    accepted = 0
+    done = False
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while not done:
+            wave = range(accepted, min(accepted + wave_size, spec.replications))
+            futures = [
+                pool.submit(run_summary_job, spec, day_idx, replication)
+                for replication in wave for day_idx in range(len(spec.days))]
+            for future in as_completed(futures):
+                replication, trips, wait_time, tis = future.result()
+                totals[replication] += (trips, wait_time, tis)
+
+            for replication in wave:
+                accepted = replication + 1
+                if accepted == spec.replications:
+                    done = True
+                elif spec.ci_half_width is not None and accepted >= min_replications:
+                    done = all(
+                        confidence_interval(i)[2] <= spec.ci_half_width
+                        for i in _replication_means(totals[:accepted]))
+                if done:
+                    break
+            print("{}: {} replications".format(spec.name, accepted))
+
+    wait_means, tis_means = _replication_means(totals[:accepted])
+    summary = {
+        "replications": accepted,
+        "wait_time": confidence_interval(wait_means),
+        "tis": confidence_interval(tis_means),
+    }
+    _write_replications(spec, wait_means, tis_means, summary)
+    return summary
+
+def _replication_means(totals):
+    """(average wait times, average times in system) of replications, from their totals"""
+    return totals[:, 1] / totals[:, 0], totals[:, 2] / totals[:, 0]
+
+def _write_replications(spec, wait_means, tis_means, summary):
+    """writes the replications' averages and their confidence intervals to the stats directory"""
+    if not os.path.exists(spec.stats_dir):
+        os.makedirs(spec.stats_dir)
+
+    with open(os.path.join(spec.stats_dir, REPLICATIONS_FILE_NAME), 'w') as rep_file:
+        print("replications:", summary["replications"], file=rep_file)
+        print("root seed:", spec.seed, file=rep_file)
+        for label, key in [("wait time", "wait_time"), ("time in system", "tis")]:
+            mean, std, half_width = summary[key]
+            print("average {0} (seconds): {1} std: {2} 95% CI: {1} +/- {3}".format(
+                label, mean, std, half_width), file=rep_file)
+        print("replication, average wait time, average time in system", file=rep_file)
+        for idx, (wait_time, tis) in enumerate(zip(wait_means, tis_means)):
+            print(idx, wait_time, tis, file=rep_file)
+
+def run_specs(specs, workers=settings.WORKERS):
+    """runs experiments, one job per (experiment, day, replication)
+
+    Args:
+        specs: list of experiment.ExperimentSpec (names must be unique)
+        workers: number of worker processes (None: one per CPU)
+    """
+    if not settings.LOG_PEOPLE:
+        raise ValueError("the runner computes stats from the person logs (settings.LOG_PEOPLE)")
+    for spec in specs:
+        if spec.replications is not None:
+            raise ValueError(
+                "experiment {!r} runs in Monte Carlo mode (see run_replications)".format(spec.name))
+    if len(set(spec.name for spec in specs)) != len(specs):
+        raise ValueError("experiment names must be unique")
+    prepare_arrivals(specs)
+
+    # build the jobs for each experiment
+    jobs = {}
+    for spec in specs:
+        shard_dir = os.path.join(os.path.dirname(spec.person_log_path), "shards")
+        jobs[spec.name] = [
+            Job(spec, day_idx, replication,
+                os.path.join(shard_dir, "{}_{}.sqlite3".format(replication, day_idx)))
+            for replication in range(len(spec.seeds)) for day_idx in range(len(spec.days))]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        remaining = {name: len(spec_jobs) for name, spec_jobs in jobs.items()}
+        futures = [pool.submit(run_job, job) for spec in specs for job in jobs[spec.name]]
+        finishing = []
+        for future in as_completed(futures):
+            job = future.result()
+            print("Done with", job.spec.name, job.spec.days[job.day_idx],
+                  "replication", job.replication)
+
+            # once all of an experiment's days are simulated, merge its logs and run its stats
+            remaining[job.spec.name] -= 1
+            if remaining[job.spec.name] == 0:
+                finishing.append(pool.submit(
+                    finish_experiment, job.spec, [i.shard_path for i in jobs[job.spec.name]]))
+
+        for future in as_completed(finishing):
+            print("done simulating", future.result().name)
+
+def run_all(specs, workers=settings.WORKERS):
+    """runs experiments: the logged ones in parallel (see run_specs), then the ones that set a
+    number of replications in Monte Carlo mode (see run_replications)
+
+    Args:
+        specs: list of experiment.ExperimentSpec (names must be unique)
+        workers: number of worker processes (None: one per CPU)
+    """
+    logged = [spec for spec in specs if spec.replications is None]
+    if logged:
+        run_specs(logged, workers=workers)
+    for spec in specs:
+        if spec.replications is not None:
+            summary = run_replications(spec, workers=workers)
+            print("{} ({} replications):".format(spec.name, summary["replications"]))
+            for label, key in [("wait time", "wait_time"), ("time in system", "tis")]:
+                mean, std, half_width = summary[key]
+                print("    average {}: {:.2f}s (std {:.2f}s, 95% CI +/- {:.2f}s)".format(
+                    label, mean, std, half_width))
+
+def main(args=None):
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description="runs experiments in parallel")
+    parser.add_argument("spec_files", nargs="+", help="experiment spec files (json/toml/yaml)")
+    parser.add_argument("--workers", type=int, default=settings.WORKERS,
+                        help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="only simulate the first LIMIT arrivals of each day")
+    args = parser.parse_args(args)
+
+    specs = [spec for path in args.spec_files for spec in experiment.load_specs(path)]
+    if args.limit is not None:
+        specs = [dataclasses.replace(spec, limit=args.limit) for spec in specs]
+
+    start = timer()
+    run_all(specs, workers=args.workers)
+    print(timer() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,4 @@
 """settings and global configurations"""
-from queue import PriorityQueue
 from os import path
 
 # configuration constants
@@ -8,25 +7,33 @@ G_ENTRY_PCT = .6
 ELEVATOR_SPEED = 1.5 # 1.5 seconds per floor traveled
 MAX_WAIT = 60   #if someone has waited > 60s
 SUPER_MAX_WAIT = 120 #if someone has waited > 120s
+INCREMENTAL_DISPATCH = False # controllers only dispatch new and affected hall calls
+ROLLOUT_HORIZON = 120 # seconds the look-ahead controller simulates each candidate car for
+ROLLOUT_WORKERS = 0 # worker processes for look-ahead branches (0: in process, None: one per CPU)
+ROLLOUT_BUDGET = None # seconds a look-ahead decision may take before falling back to nearest car
 
 # log filename
 LOG_DIR = "logs"
 PERSON_LOG_FNAME = "person.sqlite3"
 ELEVATOR_LOG_FNAME = "elevator.sqlite3"
 FLOOR_LOG_FNAME = "floor.sqlite3"
+LOG_BATCH_SIZE = 10000 # rows buffered by a logger before they are written
+LOG_TRIPS = False # log one row per trip (logger.TripLogger) instead of every state change
 
 # arrivals
 ARRIVALS_DIR = "arrivals"
 ARRIVALS_DATA_SET_CSV = path.join("data", "class_enrollment_list.csv")
+ARRIVALS_CACHE_DIR = path.join(ARRIVALS_DIR, "cache") # compiled (.npy) arrivals
 
 # logging
 VERBOSE = False
+LOG_PEOPLE = True # write the person log database (stats.py)
+STREAM_METRICS = False # compute stats while simulating (metrics.py) instead of from the log
+METRICS_BUCKET_SIZE = 300 # seconds per time of day bucket for streamed metrics
 
-# global future event queue
-#   structure of items
-#       (time_of_event, object, new_state, [args])
-FEQ = PriorityQueue()
-CURR_DAY = 0 # current day
-CURR_TIME = 0
-ELEVATORS = []
-BUILDING = None
+# experiment runner (runner.py)
+WORKERS = None # number of worker processes (None: one per CPU)
+MIN_REPLICATIONS = 3 # replications run before a confidence interval can end a Monte Carlo run
+
+# sector optimizer (optimizer.py)
+OPTIMIZER_CHECKPOINT = 3600 # simulated seconds between checks for candidates to abort early
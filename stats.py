@@ -7,165 +7,212 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 import settings
+from person import Person
 
-BASIC_ORDERED_STMT = """
-    SELECT EVENT_DAY, PERSON_ID, EVENT_TIME, STATE, ELEVATOR_ID, ORIGIN, DEST
-    FROM 'PERSON_LOGS' 
-    ORDER BY EVENT_DAY, PERSON_ID, EVENT_TIME 
+# Note: rows are read straight into typed numpy arrays (one field per column), so the order they
+#       come back in doesn't matter and no ORDER BY is needed
+STATE_LOG_STMT = """
+    SELECT EVENT_DAY, PERSON_ID, EVENT_TIME, STATE, ORIGIN, DEST
+    FROM PERSON_LOGS
 """
 
-QUEUE_LEN_STMT = """
-WITH NUM_DAYS AS (
-    SELECT MAX(EVENT_DAY) + 1 as NUM
-    FROM PERSON_LOGS
-)
-SELECT 
-    EVENT_TIME, 
-    CASE 
-        WHEN STATE == 'States.QUEUED' THEN 1.0/(SELECT NUM FROM NUM_DAYS LIMIT 1)
-        WHEN STATE == 'States.SERVICE' THEN -1.0/(SELECT NUM FROM NUM_DAYS LIMIT 1)
-    ELSE
-        0
-    END AS QUEUE_LEN_CHNG
-FROM PERSON_LOGS
-ORDER BY EVENT_TIME
+TRIPS_STMT = """
+    SELECT EVENT_DAY, QUEUED_TIME, BOARDED_TIME, ALIGHTED_TIME, ORIGIN, DEST
+    FROM TRIPS
 """
 
+STATE_LOG_DTYPE = np.dtype([
+    ('day', np.int32),
+    ('person', np.int64),
+    ('time', np.float64),
+    ('state', np.int8),
+    ('origin', np.int32),
+    ('dest', np.int32),
+])
+
+TRIP_DTYPE = np.dtype([
+    ('day', np.int32),
+    ('queued', np.float64),
+    ('boarded', np.float64),
+    ('alighted', np.float64),
+    ('origin', np.int32),
+    ('dest', np.int32),
+])
 
 STATS_DIR = "stats"
 STATS_FILE_NAME = "stats.txt"
 PERSON_LOG_PATH = os.path.join(settings.LOG_DIR, settings.PERSON_LOG_FNAME)
 
-def run_stats(person_log_path=PERSON_LOG_PATH, stats_dir=STATS_DIR):
-    """run stats for files"""
+def run_stats(person_log_path=PERSON_LOG_PATH, stats_dir=STATS_DIR, floor_names=None):
+    """run stats for files
 
-     # create statistics file
+    Args:
+        person_log_path: path of the person log database
+        stats_dir: directory the stats are written to
+        floor_names: (optional) names of the building's floors, bottom to top (see
+                     Building.floor_order), floors are labeled by index if not given
+    """
+
+     # create statistics directory
     if not os.path.exists(stats_dir):
         os.makedirs(stats_dir)
-    stats_file = open(os.path.join(stats_dir, STATS_FILE_NAME), 'w')
 
     # open person event database
     if os.path.isfile(person_log_path):
         person_conn = sqlite3.connect(person_log_path)
-        person_cur = person_conn.cursor()
     else:
         raise LookupError("Person Log database doesn't exist")
 
     # fetch basic data (used for multiple things)
-    person_cur.execute(BASIC_ORDERED_STMT)
-    basic_data = np.array(person_cur.fetchall())
-
-    idle_rows = np.where(basic_data[:, 3] == "States.IDLE")[0]
-    idle_vals = basic_data[idle_rows, 2].astype(dtype=np.float32)
-    service_vals = basic_data[idle_rows - 1, 2].astype(dtype=np.float32)
-    queued_vals = basic_data[idle_rows - 2, 2].astype(dtype=np.float32)
+    trips = load_trips(person_conn)
+    person_conn.close()
 
-    ## average wait time
-    avg_wait_time = np.mean(np.subtract(service_vals, queued_vals))
-    print("average wait time (seconds):", avg_wait_time, file=stats_file)
+    wait_time = trips['boarded'] - trips['queued']
+    tis = trips['alighted'] - trips['queued']
 
-    avg_wait_time = np.std(np.subtract(service_vals, queued_vals))
-    print("wait time standard deviation (seconds):", avg_wait_time, file=stats_file)
+    with open(os.path.join(stats_dir, STATS_FILE_NAME), 'w') as stats_file:
+        ## average wait time
+        print("average wait time (seconds):", np.mean(wait_time), file=stats_file)
+        print("wait time standard deviation (seconds):", np.std(wait_time), file=stats_file)
 
-    ## determine average time in system
-    avg_tis = np.mean(np.subtract(idle_vals, queued_vals))
-    print("average time in system (seconds):", avg_tis, file=stats_file)
+        ## determine average time in system
+        print("average time in system (seconds):", np.mean(tis), file=stats_file)
 
     ## time in system vs floors traveled
-    tis_vs_floors = np.zeros((idle_vals.shape[0], 2), dtype=np.float32)
-    tis_vs_floors[:, 1] = idle_vals - queued_vals
-    dest = basic_data[idle_rows, 6].astype(dtype=np.int32)
-    origin = basic_data[idle_rows, 5].astype(dtype=np.int32)
-    tis_vs_floors[:, 0] = np.absolute(dest - origin)
-
-    # find the average for each floor delta
-    tis_vs_floors = tis_vs_floors[tis_vs_floors[:, 0].argsort()]
-    floor_diff_data = np.split(
-        tis_vs_floors,
-        np.where(np.diff(tis_vs_floors[:, 0]))[0]+1)
-
-    x = []
-    y = []
-    for i in floor_diff_data:
-        x.append(int(i[0, 0]))
-        y.append(np.mean(i[:, 1]))
+    floors_traveled, avg_tis = group_mean(np.absolute(trips['dest'] - trips['origin']), tis)
+    bar_plot(
+        floors_traveled, avg_tis,
+        "Floors Traveled", "Time in System (seconds)",
+        os.path.join(stats_dir, "tis_vs_travel_distance.png"))
 
-    plt.clf()
+    ## avg wait time vs. arrival time (arrival == queued time)
+    scatter_plot(
+        trips['queued'], wait_time,
+        "Arrival Time (seconds since 12AM)", "Wait Time (seconds)",
+        os.path.join(stats_dir, "wait_time_vs_tod.png"))
 
-    y_pos = np.arange(len(x))
-    rects = plt.bar(y_pos, y, align='center', alpha=0.5)
-    plt.xticks(y_pos, x)
-    plt.ylabel("Time in System (seconds)")
-    plt.xlabel("Floors Traveled")
-    autolabel(rects, plt)
-    plt.savefig(os.path.join(stats_dir, ".".join(["tis_vs_travel_distance", "png"])))
+    ## avg time in system vs. arrival time (arrival == queued time)
+    scatter_plot(
+        trips['queued'], tis,
+        "Arrival Time (seconds since 12AM)", "Time in System (seconds)",
+        os.path.join(stats_dir, "tis_vs_tod.png"))
 
+    ## time in system vs origin floor
+    origins, avg_tis = group_mean(trips['origin'], tis)
+    bar_plot(
+        [str(i) if floor_names is None else floor_names[i] for i in origins], avg_tis,
+        "Origin Floor", "Time in System (seconds)",
+        os.path.join(stats_dir, "tis_vs_origin_floor.png"))
 
-    ## avg wait time vs. arrival time (arrival == queued time)
-    wait_time_vs_time = np.zeros((idle_vals.shape[0], 2), dtype=np.float32)
-    wait_time_vs_time[:, 0] = basic_data[idle_rows - 2, 2].astype(dtype=np.float32)
-    wait_time_vs_time[:, 1] = service_vals - queued_vals
+    ## average queue length throughout the day
+    # +1 when someone queues, -1 when they board, averaged over the number of days simulated
+    num_days = trips['day'].max() + 1 if len(trips) > 0 else 1
+    times = np.concatenate((trips['queued'], trips['boarded']))
+    changes = np.concatenate((np.ones(len(trips)), -np.ones(len(trips)))) / num_days
+    order = np.argsort(times, kind='stable')
+    line_plot(
+        times[order], np.cumsum(changes[order]),
+        "Arrival Time (seconds since 12AM)", "Queue Length (all floors)",
+        os.path.join(stats_dir, "avg_queue_len.png"))
+
+def load_trips(conn):
+    """reads one entry per completed trip from a log database
+
+    Reads the TRIPS table written by logger.TripLogger if there is one, otherwise rebuilds trips
+    from the state changes written by logger.PersonLogger.
+
+    Args:
+        conn: sqlite3 connection to the log database
+
+    Ret:
+        structured numpy array (dtype TRIP_DTYPE), one entry per trip
+    """
+    if has_trips_table(conn):
+        return np.fromiter(conn.execute(TRIPS_STMT), dtype=TRIP_DTYPE)
+    return trips_from_state_log(np.fromiter(conn.execute(STATE_LOG_STMT), dtype=STATE_LOG_DTYPE))
 
-    x = wait_time_vs_time[:, 0]
-    y = wait_time_vs_time[:, 1]
-    plt.clf()
-    plt.scatter(x, y, s=2, lw=0)
-    plt.ylabel("Wait Time (seconds)")
-    plt.xlabel("Arrival Time (seconds since 12AM)")
-    plt.savefig(os.path.join(stats_dir, ".".join(["wait_time_vs_tod", "png"])))
+def trips_from_state_log(log):
+    """rebuilds trips from a state change log
 
-    ## avg time in system vs. arrival time (arrival == queued time)
-    tis_vs_time = np.zeros((idle_vals.shape[0], 2), dtype=np.float32)
-    tis_vs_time[:, 0] = basic_data[idle_rows - 2, 2].astype(dtype=np.float32)
-    tis_vs_time[:, 1] = idle_vals - queued_vals
+    Each person is logged once when they queue, once when they board and once when they reach
+    their destination (go idle). Rows are matched on (day, person id) with a sort and binary
+    search per state rather than by ordering the whole log.
 
-    x = tis_vs_time[:, 0]
-    y = tis_vs_time[:, 1]
-    plt.clf()
-    plt.scatter(x, y, s=2, lw=0)
-    plt.ylabel("Time in System (seconds)")
-    plt.xlabel("Arrival Time (seconds since 12AM)")
-    plt.savefig(os.path.join(stats_dir, ".".join(["tis_vs_tod", "png"])))
+    Args:
+        log: structured numpy array (dtype STATE_LOG_DTYPE), in any order
 
-    ## time in system vs origin floor
-    tis_vs_origin = np.zeros((idle_vals.shape[0], 2), dtype=np.float32)
-    tis_vs_origin[:, 1] = idle_vals - queued_vals
-    tis_vs_origin[:, 0] = origin = basic_data[idle_rows, 5].astype(dtype=np.int32)
-
-    # find the average for each origin floor
-    tis_vs_origin = tis_vs_origin[tis_vs_origin[:, 0].argsort()]
-    floor_origin_data = np.split(
-        tis_vs_origin,
-        np.where(np.diff(tis_vs_origin[:, 0]))[0]+1)
-
-    x = []
-    y = []
-    floor_names = ['SB', 'B', 'G', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12']
-    for i in floor_origin_data:
-        x.append(floor_names[int(i[0, 0])])
-        y.append(np.mean(i[:, 1]))
+    Ret:
+        structured numpy array (dtype TRIP_DTYPE), one entry per person that reached their
+        destination
+    """
+    if len(log) == 0:
+        return np.empty(0, dtype=TRIP_DTYPE)
+
+    # unique key for each person's trip
+    key = log['day'] * (log['person'].max() + 1) + log['person']
+
+    idle = log['state'] == Person.States.IDLE.value
+    trips = np.empty(np.count_nonzero(idle), dtype=TRIP_DTYPE)
+    trips['day'] = log['day'][idle]
+    trips['alighted'] = log['time'][idle]
+    trips['origin'] = log['origin'][idle]
+    trips['dest'] = log['dest'][idle]
 
+    for state, field in [(Person.States.QUEUED, 'queued'), (Person.States.SERVICE, 'boarded')]:
+        rows = np.flatnonzero(log['state'] == state.value)
+        rows = rows[np.argsort(key[rows])]
+        trips[field] = log['time'][rows[np.searchsorted(key[rows], key[idle])]]
+
+    return trips
+
+def group_mean(keys, values):
+    """averages values by key
+
+    Args:
+        keys: array of non-negative ints
+        values: array of values, the same length as keys
+
+    Ret:
+        (sorted array of distinct keys, array of the mean value for each key)
+    """
+    counts = np.bincount(keys)
+    sums = np.bincount(keys, weights=values)
+    present = np.flatnonzero(counts)
+    return present, sums[present] / counts[present]
+
+def has_trips_table(conn):
+    """returns whether or not a log database was written by logger.TripLogger"""
+    cur = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'TRIPS'")
+    return cur.fetchone()[0] > 0
+
+def bar_plot(x, y, xlabel, ylabel, path):
+    """saves a labeled bar plot of y for each category in x"""
     plt.clf()
 
     y_pos = np.arange(len(x))
     rects = plt.bar(y_pos, y, align='center', alpha=0.5)
     plt.xticks(y_pos, x)
-    plt.ylabel("Time in System (seconds)")
-    plt.xlabel("Origin Floor")
+    plt.ylabel(ylabel)
+    plt.xlabel(xlabel)
     autolabel(rects, plt)
-    plt.savefig(os.path.join(stats_dir, ".".join(["tis_vs_origin_floor", "png"])))
+    plt.savefig(path)
 
-    ## average queue length throughout the day
-    person_cur.execute(QUEUE_LEN_STMT)
-    queue_len_data = person_cur.fetchall()
+def scatter_plot(x, y, xlabel, ylabel, path):
+    """saves a scatter plot of y vs x"""
+    plt.clf()
+    plt.scatter(x, y, s=2, lw=0)
+    plt.ylabel(ylabel)
+    plt.xlabel(xlabel)
+    plt.savefig(path)
 
-    x, y = zip(*queue_len_data)
-    y = np.cumsum(np.array(y, dtype=np.float32))
+def line_plot(x, y, xlabel, ylabel, path):
+    """saves a line plot of y vs x"""
     plt.clf()
     plt.plot(x, y, color='r', linestyle='-')
-    plt.ylabel("Queue Length (all floors)")
-    plt.xlabel("Arrival Time (seconds since 12AM)")
-    plt.savefig(os.path.join(stats_dir, ".".join(["avg_queue_len", "png"])))
+    plt.ylabel(ylabel)
+    plt.xlabel(xlabel)
+    plt.savefig(path)
 
 def autolabel(rects, plot):
     """
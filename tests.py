@@ -1,329 +1,90 @@
-"""handles all testing for the simulation models"""
+"""handles all testing for the simulation models
+
+The experiments themselves are described in experiments.json (see experiment.ExperimentSpec).
+"""
+import dataclasses
 import os
+import tempfile
 from timeit import default_timer as timer
 
-import settings
-from person import ArrivalGenerator
 from building import Building
-import elevators
+from engine import Simulation
+import experiment
 import logger
-
+import runner
 import stats as sim_stats
 
-BASE_DIR = "experiments"
-
-def test_scan_elevator(limit=None):
-    """method that tests the scan elevator"""
-
-    result_dir = "scan"
-
-    # create directory if not existing
-    dirs = os.path.join(BASE_DIR, result_dir)
-    if not os.path.exists(dirs):
-        os.makedirs(dirs)
-
-    # create loggers
-    person_logger_path = os.path.join(dirs, settings.LOG_DIR, settings.PERSON_LOG_FNAME)
-    person_logger = logger.PersonLogger(person_logger_path, remove_old=True)
-    # create building
-    building = Building([
-        'SB', 'B', 'G', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12',])
-
-    # generate arrivals
-    arr_gen = ArrivalGenerator(building=building, person_logger=person_logger)
-
-    days = ["M", "Tu", "W", "Th", "F"]
-
-    for day in days:
-        # load saved arrivals or generate new arrivals
-        arr_gen.arrival_times = []
-        save_path = os.path.join(settings.ARRIVALS_DIR, "{}_arrivals.csv".format(day))
-        if not os.path.exists(save_path):
-            arr_gen.gen_from_classes(file_path=settings.ARRIVALS_DATA_SET_CSV, days=[day])
-            arr_gen.save(save_path)
-        else:
-            arr_gen.load(save_path)
-
-        # add first 100 floor arrivals to FEQ
-        cnt = 0
-        for time, person in arr_gen.arrival_times:
-            cnt += 1
-            if limit is not None and cnt > limit:
-                break
-            settings.FEQ.put_nowait((time, person, person.States.QUEUED))
-
-        # create 6 elevators
-        settings.ELEVATORS = []
-        for _ in range(6):
-            settings.ELEVATORS.append(elevators.ScanElevator(None, building))
-
-        while not settings.FEQ.empty():
-            curr_time, obj, state = settings.FEQ.get_nowait()
-            settings.CURR_TIME = curr_time
-            obj.update_state(state)
-
-        # commit changes to person_logger
-        person_logger.conn.commit()
-        print("Done with", day)
-
-    sim_stats.run_stats(person_log_path=person_logger_path, stats_dir=os.path.join(dirs, "stats"))
-    print("done simulating", result_dir)
-
-
-def test_look_elevator(limit=None):
-    """method that tests the look elevator"""
-
-    result_dir = "look"
-
-    # create directory if not existing
-    dirs = os.path.join(BASE_DIR, result_dir)
-    if not os.path.exists(dirs):
-        os.makedirs(dirs)
-
-    # create loggers
-    person_logger_path = os.path.join(dirs, settings.LOG_DIR, settings.PERSON_LOG_FNAME)
-    person_logger = logger.PersonLogger(person_logger_path, remove_old=True)
-    # create building
-    building = Building([
-        'SB', 'B', 'G', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12',])
-
-    # generate arrivals
-    arr_gen = ArrivalGenerator(building=building, person_logger=person_logger)
-
-    days = ["M", "Tu", "W", "Th", "F"]
-
-    for day in days:
-        # load saved arrivals or generate new arrivals
-        arr_gen.arrival_times = []
-        save_path = os.path.join(settings.ARRIVALS_DIR, "{}_arrivals.csv".format(day))
-        if not os.path.exists(save_path):
-            arr_gen.gen_from_classes(file_path=settings.ARRIVALS_DATA_SET_CSV, days=[day])
-            arr_gen.save(save_path)
-        else:
-            arr_gen.load(save_path)
-
-        # add first 100 floor arrivals to FEQ
-        cnt = 0
-        for time, person in arr_gen.arrival_times:
-            cnt += 1
-            if limit is not None and cnt > limit:
-                break
-            settings.FEQ.put_nowait((time, person, person.States.QUEUED))
-
-        # create 6 elevators
-        settings.ELEVATORS = []
-        for _ in range(6):
-            settings.ELEVATORS.append(elevators.LookElevator(None, building))
-
-        while not settings.FEQ.empty():
-            curr_time, obj, state = settings.FEQ.get_nowait()
-            settings.CURR_TIME = curr_time
-            obj.update_state(state)
-
-        # commit changes to person_logger
-        person_logger.conn.commit()
-        print("Done with", day)
-
-    sim_stats.run_stats(person_log_path=person_logger_path, stats_dir=os.path.join(dirs, "stats"))
-    print("done simulating", result_dir)
-
-def test_nearest_elevator(limit=None):
-    """method that tests nearest car first elevator"""
-
-    result_dir = "nearest"
-
-    # create directory if not existing
-    dirs = os.path.join(BASE_DIR, result_dir)
-    if not os.path.exists(dirs):
-        os.makedirs(dirs)
-
-    # create loggers
-    person_logger_path = os.path.join(dirs, settings.LOG_DIR, settings.PERSON_LOG_FNAME)
-    person_logger = logger.PersonLogger(person_logger_path, remove_old=True)
-    # create building
-    building = Building([
-        'SB', 'B', 'G', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12',])
-
-    # generate arrivals
-    arr_gen = ArrivalGenerator(building=building, person_logger=person_logger)
-
-    days = ["M", "Tu", "W", "Th", "F"]
-
-    for day in days:
-        # load saved arrivals or generate new arrivals
-        arr_gen.arrival_times = []
-        save_path = os.path.join(settings.ARRIVALS_DIR, "{}_arrivals.csv".format(day))
-        if not os.path.exists(save_path):
-            arr_gen.gen_from_classes(file_path=settings.ARRIVALS_DATA_SET_CSV, days=[day])
-            arr_gen.save(save_path)
-        else:
-            arr_gen.load(save_path)
-
-        # add first 100 floor arrivals to FEQ
-        cnt = 0
-        for time, person in arr_gen.arrival_times:
-            cnt += 1
-            if limit is not None and cnt > limit:
-                break
-            settings.FEQ.put_nowait((time, person, person.States.QUEUED))
-
-        # create 6 elevators
-        settings.ELEVATORS = []
-        controller = elevators.NearestCarElevatorController(building)
-        controller.spawn_elevators(6, person_logger, building)
-        settings.ELEVATORS.extend(controller.elevators)
-
-        while not settings.FEQ.empty():
-            curr_time, obj, state = settings.FEQ.get_nowait()
-            settings.CURR_TIME = curr_time
-            obj.update_state(state)
-
-        # commit changes to person_logger
-        person_logger.conn.commit()
-        print("Done with", day)
-
-    sim_stats.run_stats(person_log_path=person_logger_path, stats_dir=os.path.join(dirs, "stats"))
-    print("done simulating", result_dir)
-
-def test_sector_elevator(limit=None):
-    """test for testing fixed sector algorithm"""
-
-    result_dir = "FS0"
-
-    # create directory if not existing
-    dirs = os.path.join(BASE_DIR, result_dir)
-    if not os.path.exists(dirs):
-        os.makedirs(dirs)
-
-    # create loggers
-    person_logger_path = os.path.join(dirs, settings.LOG_DIR, settings.PERSON_LOG_FNAME)
-    person_logger = logger.PersonLogger(person_logger_path, remove_old=True)
-    # create building
-    building = Building([
-        'SB', 'B', 'G', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12',])
-
-    # generate arrivals
-    arr_gen = ArrivalGenerator(building=building, person_logger=person_logger)
-
-    days = ["M", "Tu", "W", "Th", "F"]
-
-    for day in days:
-        # load saved arrivals or generate new arrivals
-        arr_gen.arrival_times = []
-        save_path = os.path.join(settings.ARRIVALS_DIR, "{}_arrivals.csv".format(day))
-        if not os.path.exists(save_path):
-            arr_gen.gen_from_classes(file_path=settings.ARRIVALS_DATA_SET_CSV, days=[day])
-            arr_gen.save(save_path)
-        else:
-            arr_gen.load(save_path)
-
-        # add first 100 floor arrivals to FEQ
-        cnt = 0
-        for time, person in arr_gen.arrival_times:
-            cnt += 1
-            if limit is not None and cnt > limit:
-                break
-            settings.FEQ.put_nowait((time, person, person.States.QUEUED))
-
-        # create 6 elevators
-        settings.ELEVATORS = []
-        controller = elevators.FixedSectorsElevatorController(building)
-        controller.spawn_elevators(6, person_logger, building)
-        #SET SECTORS
-        controller.set_sector(0, ['G', '1'], ['1', '3'])
-        controller.set_sector(1, ['G', '1'], ['1', '3'])
-        controller.set_sector(2, ['G', '1'], ['1', '3'])
-        controller.set_sector(3, ['G', '1'], ['10', '12'])
-        controller.set_sector(4, ['SB', '11'], ['B', '12'])
-        controller.set_sector(5, ['SB', 'B'], ['G', '1'])
-        settings.ELEVATORS.extend(controller.elevators)
-
-        while not settings.FEQ.empty():
-            curr_time, obj, state = settings.FEQ.get_nowait()
-            settings.CURR_TIME = curr_time
-            obj.update_state(state)
-
-        # commit changes to person_logger
-        person_logger.conn.commit()
-        print("Done with", day)
-
-        settings.CURR_DAY += 1
-
-    sim_stats.run_stats(person_log_path=person_logger_path, stats_dir=os.path.join(dirs, "stats"))
-    print("done simulating", result_dir)
-
-def test_sector_time_elevator(limit=None):
-    """test for testing fixed sector algorithm"""
-    result_dir = "FS4"
-
-    # create directory if not existing
-    dirs = os.path.join(BASE_DIR, result_dir)
-    if not os.path.exists(dirs):
-        os.makedirs(dirs)
-
-    # create loggers
-    person_logger_path = os.path.join(dirs, settings.LOG_DIR, settings.PERSON_LOG_FNAME)
-    person_logger = logger.PersonLogger(person_logger_path, remove_old=True)
-    # create building
-    building = Building([
-        'SB', 'B', 'G', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12',])
-
-    # generate arrivals
-    arr_gen = ArrivalGenerator(building=building, person_logger=person_logger)
-
-    days = ["M", "Tu", "W", "Th", "F"]
-
-    for day in days:
-        # load saved arrivals or generate new arrivals
-        arr_gen.arrival_times = []
-        save_path = os.path.join(settings.ARRIVALS_DIR, "{}_arrivals.csv".format(day))
-        if not os.path.exists(save_path):
-            arr_gen.gen_from_classes(file_path=settings.ARRIVALS_DATA_SET_CSV, days=[day])
-            arr_gen.save(save_path)
-        else:
-            arr_gen.load(save_path)
-
-        # add first 100 floor arrivals to FEQ
-        cnt = 0
-        for time, person in arr_gen.arrival_times:
-            cnt += 1
-            if limit is not None and cnt > limit:
-                break
-            settings.FEQ.put_nowait((time, person, person.States.QUEUED))
-
-        # create 6 elevators
-        settings.ELEVATORS = []
-        controller = elevators.FixedSectorsTimePriorityElevatorController(building)
-        controller.spawn_elevators(6, person_logger, building)
-        #SET SECTORS
-        controller.set_sector(0, ['G', '1'], ['1', '3'])
-        controller.set_sector(1, ['G', '1'], ['1', '3'])
-        controller.set_sector(2, ['G', '1'], ['1', '3'])
-        controller.set_sector(3, ['G', '1'], ['10', '12'])
-        controller.set_sector(4, ['SB', '11'], ['B', '12'])
-        controller.set_sector(5, ['SB', 'B'], ['G', '1'])
-        settings.ELEVATORS.extend(controller.elevators)
-
-        while not settings.FEQ.empty():
-            curr_time, obj, state = settings.FEQ.get_nowait()
-            settings.CURR_TIME = curr_time
-            obj.update_state(state)
-
-        # commit changes to person_logger
-        person_logger.conn.commit()
-        print("Done with", day)
-
-    sim_stats.run_stats(person_log_path=person_logger_path, stats_dir=os.path.join(dirs, "stats"))
-    print("done simulating", result_dir)
+SPECS_PATH = "experiments.json"
+
+
+def test_experiment(name, limit=None):
+    """runs a single experiment from SPECS_PATH (serially, Monte Carlo experiments replicate in
+    parallel)
+
+    Args:
+        name: name of the experiment ex: "look"
+        limit: (optional) only simulate the first <limit> arrivals of each day
+    """
+    for spec in experiment.load_specs(SPECS_PATH):
+        if spec.name == name:
+            if spec.replications is not None:
+                runner.run_all([dataclasses.replace(spec, limit=limit)])
+            else:
+                experiment.run_experiment(dataclasses.replace(spec, limit=limit))
+            return
+    raise LookupError("no experiment named {!r} in {}".format(name, SPECS_PATH))
+
+def test_restart(name="look", day="W", checkpoint=12 * 3600, crash=15 * 3600):
+    """checks that a run restarted from a snapshot logs the same as an uninterrupted run
+
+    The day is simulated straight through, and again with a snapshot taken at <checkpoint>: that
+    run goes on until <crash> and is abandoned with everything it logged written to the database,
+    then the snapshot is restored and run to the end. Both logs must give the same stats.
+
+    Args:
+        name: name of the experiment in SPECS_PATH ex: "look"
+        day: day simulated
+        checkpoint: time (seconds since 12AM) the snapshot is taken at
+        crash: time (seconds since 12AM) the first run is abandoned at
+    """
+    specs = [i for i in experiment.load_specs(SPECS_PATH) if i.name == name]
+    if not specs:
+        raise LookupError("no experiment named {!r} in {}".format(name, SPECS_PATH))
+    spec = dataclasses.replace(specs[0], days=[day])
+
+    results = []
+    out_dir = tempfile.mkdtemp()
+    for restart in [False, True]:
+        log_path = os.path.join(out_dir, "restart" if restart else "straight", "person.sqlite3")
+        person_logger = logger.create_person_logger(log_path, remove_old=True, fast=True)
+        if person_logger is None:
+            raise ValueError("checking restarts needs the person log (settings.LOG_PEOPLE)")
+        sim = experiment.setup_day(spec, Building(spec.floors), 0, 0, person_logger)
+        if restart:
+            sim.run(until=checkpoint)
+            snapshot = sim.snapshot()
+            sim.run(until=crash)
+            sim.person_logger.close()
+            sim = Simulation.restore(snapshot)
+        sim.run()
+        sim.person_logger.close()
+
+        stats_dir = os.path.join(os.path.dirname(log_path), "stats")
+        sim_stats.run_stats(person_log_path=log_path, stats_dir=stats_dir, floor_names=spec.floors)
+        with open(os.path.join(stats_dir, sim_stats.STATS_FILE_NAME), 'r') as stats_file:
+            results.append(stats_file.read())
+
+    if results[0] != results[1]:
+        raise AssertionError("restarted run's stats differ:\n{}\nvs uninterrupted:\n{}".format(
+            results[1], results[0]))
+    print("restart from {}s matches the uninterrupted run".format(checkpoint))
 
 if __name__ == '__main__':
     START = timer()
 
-    test_scan_elevator()
-    test_look_elevator()
-    test_nearest_elevator()
-    test_sector_elevator()
-    test_sector_time_elevator()
+    # every experiment and day as a parallel job (Monte Carlo experiments replicate until their
+    # confidence intervals are narrow enough)
+    runner.run_all(experiment.load_specs(SPECS_PATH))
 
     END = timer()
     print(END - START)